@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -139,11 +140,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/static/'
-MEDIA_URL = '/static/media/'
+# Media is only served to its owners, see recipe.views.RecipeMediaView.
+MEDIA_URL = '/api/recipe/media/'
 
 MEDIA_ROOT= '/vol/web/media'
 STATIC_ROOT= '/vol/web/static'
 
+# Internal nginx location mapped to MEDIA_ROOT, unset serves files from Django.
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT')
+
+# Bounding boxes of the resized copies made by the process_images worker.
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+    'large': (1200, 1200),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -153,8 +165,44 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'recipe.pagination.RecipeCursorPagination',
+    'PAGE_SIZE': 100,
+    # orjson backed JSON with the same bytes as DRF's JSONRenderer/
+    # JSONParser. orjson is optional, without it the json module is used.
+    'DEFAULT_RENDERER_CLASSES': [
+        'recipe.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'recipe.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
-}
\ No newline at end of file
+}
+
+# Cache for list responses, keyed on the user's data version. Use
+# 'core.cache.DjangoCache' with an 'alias' option to share entries
+# between workers through CACHES.
+RECIPE_RESPONSE_CACHE = {
+    'BACKEND': 'core.cache.LRUCache',
+    'OPTIONS': {
+        'max_entries': 1024,
+        'timeout': 300,
+    },
+}
+
+# Token -> user lookups cached by core.authentication. The local LRU
+# keeps a short TTL since other workers cannot invalidate it; set the
+# shared tier to a DjangoCache config to share entries between workers.
+TOKEN_AUTH_CACHE = {
+    'BACKEND': 'core.cache.LRUCache',
+    'OPTIONS': {
+        'max_entries': 4096,
+        'timeout': 30,
+    },
+}
+TOKEN_AUTH_SHARED_CACHE = None
@@ -20,9 +20,6 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
-from django.conf.urls.static import static
-from django.conf import settings
-
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
@@ -33,10 +30,4 @@ urlpatterns = [
     ),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT,
-    )
\ No newline at end of file
+]
\ No newline at end of file
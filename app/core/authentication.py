@@ -0,0 +1,64 @@
+"""
+    Authentication classes for the API
+"""
+import copy
+import hashlib
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import get_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+        Token authentication that caches token -> user lookups in a
+        bounded in-process LRU, optionally backed by a shared cache.
+        Entries are dropped when the token is deleted or its user saved;
+        other processes' LRUs expire within their (short) TTL.
+    """
+    local_cache = 'TOKEN_AUTH_CACHE'
+    shared_cache = 'TOKEN_AUTH_SHARED_CACHE'
+
+    @classmethod
+    def _caches(cls):
+        caches = [get_cache(cls.local_cache)]
+        if getattr(settings, cls.shared_cache, None):
+            caches.append(get_cache(cls.shared_cache))
+
+        return caches
+
+    @staticmethod
+    def _cache_key(key):
+        return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def invalidate(cls, key):
+        """ Drop a token from every cache tier """
+        cache_key = cls._cache_key(key)
+        for cache in cls._caches():
+            cache.delete(cache_key)
+
+    @classmethod
+    def stats(cls):
+        """ Return the hit/miss counters of every cache tier """
+        return [cache.stats() for cache in cls._caches()]
+
+    def authenticate_credentials(self, key):
+        cache_key = self._cache_key(key)
+        local, *shared = self._caches()
+        entry = local.get(cache_key)
+
+        if entry is None and shared:
+            entry = shared[0].get(cache_key)
+            if entry is not None:
+                local.set(cache_key, entry)
+
+        if entry is None:
+            entry = super().authenticate_credentials(key)
+            for cache in (local, *shared):
+                cache.set(cache_key, entry)
+
+        # Views may modify request.user, never hand out the cached object.
+        user, token = entry
+        return (copy.copy(user), token)
@@ -0,0 +1,129 @@
+"""
+    Pluggable caches used by the API
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class BaseCache:
+    """ Common interface for cache backends, counts hits and misses """
+
+    def __init__(self, timeout=300):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Return the value for key or None, recording hit or miss """
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def stats(self):
+        """ Return the hit and miss counters """
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(BaseCache):
+    """ Bounded in-process LRU cache with a TTL per entry """
+
+    def __init__(self, max_entries=1024, timeout=300):
+        super().__init__(timeout=timeout)
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCache(BaseCache):
+    """ Adapter over a cache configured in Django's CACHES setting """
+
+    def __init__(self, alias='default', timeout=300):
+        super().__init__(timeout=timeout)
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        self._cache.set(key, value, timeout)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+
+@lru_cache(maxsize=None)
+def get_cache(setting_name):
+    """ Return the cache backend configured by a setting """
+    config = getattr(settings, setting_name)
+    backend = import_string(config['BACKEND'])
+
+    return backend(**config.get('OPTIONS', {}))
@@ -0,0 +1,175 @@
+"""
+    Recipe image variant generation
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.models import Recipe, StoredFile, User, recipe_image_storage
+
+UPLOAD_DIR = 'uploads/recipe'
+VARIANT_DIR = 'uploads/recipe/variants'
+
+# A job still processing after its lease is taken to belong to a worker
+# that died, and is handed out again until it was claimed MAX_ATTEMPTS
+# times.
+CLAIM_LEASE = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def get_variant_sizes():
+    """ Return the configured variant name to (width, height) mapping """
+    return settings.RECIPE_IMAGE_VARIANTS
+
+
+def variant_name(name, variant):
+    """
+        Return the storage name of a variant of the image `name`. Images
+        are content addressed, so variants are shared like the original.
+    """
+    shards = os.path.relpath(os.path.dirname(name), UPLOAD_DIR)
+    filename = f'{os.path.basename(name)}-{variant}.jpg'
+
+    return os.path.normpath(os.path.join(VARIANT_DIR, shards, filename))
+
+
+def source_name(name):
+    """
+        Return the image a stored file belongs to, the file itself for
+        originals and None for variants of unknown sizes
+    """
+    if not name.startswith(f'{VARIANT_DIR}/'):
+        return name
+
+    shards, filename = os.path.split(os.path.relpath(name, VARIANT_DIR))
+    for variant in get_variant_sizes():
+        suffix = f'-{variant}.jpg'
+        if filename.endswith(suffix):
+            return os.path.normpath(
+                os.path.join(UPLOAD_DIR, shards, filename[:-len(suffix)])
+            )
+
+    return None
+
+
+def make_variants(source_path, root, name, sizes):
+    """
+        Write resized JPEG copies of the image at `source_path` below
+        `root` and return their storage names. Runs in worker processes,
+        so it only touches the file system.
+    """
+    names = {variant: variant_name(name, variant) for variant in sizes}
+    if all(os.path.exists(os.path.join(root, n)) for n in names.values()):
+        return names
+
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        for variant, size in sizes.items():
+            copy = img.copy()
+            copy.thumbnail(size, Image.LANCZOS)
+
+            path = os.path.join(root, names[variant])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            copy.save(tmp_path, format='JPEG', quality=85, optimize=True)
+            os.replace(tmp_path, path)
+
+    return names
+
+
+def claim_pending(limit, lease=CLAIM_LEASE, max_attempts=MAX_ATTEMPTS):
+    """
+        Mark up to `limit` queued recipe images as processing and return
+        them, starting with jobs whose lease ran out. Those that already
+        used up their attempts are marked as failed instead. Locked rows
+        are skipped so several workers can share the queue.
+    """
+    now = timezone.now()
+    expired = Recipe.objects.filter(
+        image_status=Recipe.IMAGE_PROCESSING,
+        image_claimed_at__lt=now - lease,
+    ).select_for_update(skip_locked=True)
+
+    with transaction.atomic():
+        given_up = list(
+            expired
+            .filter(image_attempts__gte=max_attempts)
+            .values('id', 'user_id')
+        )
+        Recipe.objects.filter(id__in=[job['id'] for job in given_up]).update(
+            image_status=Recipe.IMAGE_FAILED,
+            image_variants={},
+            updated_at=now,
+        )
+
+        jobs = list(
+            expired
+            .order_by('image_claimed_at')
+            .values('id', 'user_id', 'image')[:limit]
+        )
+        if len(jobs) < limit:
+            jobs += list(
+                Recipe.objects
+                .filter(image_status=Recipe.IMAGE_PENDING)
+                .order_by('id')
+                .select_for_update(skip_locked=True)
+                .values('id', 'user_id', 'image')[:limit - len(jobs)]
+            )
+        Recipe.objects.filter(id__in=[job['id'] for job in jobs]).update(
+            image_status=Recipe.IMAGE_PROCESSING,
+            image_claimed_at=now,
+            image_attempts=F('image_attempts') + 1,
+            updated_at=now,
+        )
+        # The status is part of the recipe, so ETags and cached lists
+        # must change with it.
+        for user_id in {job['user_id'] for job in given_up + jobs}:
+            User.objects.bump_data_version(user_id)
+
+    for job in jobs:
+        job['image_claimed_at'] = now
+
+    return jobs
+
+
+def finish(job, variants=None):
+    """
+        Store the outcome of a job. Nothing is written if the recipe got
+        a new image while the job was running, that upload is queued on
+        its own, or if the job was reclaimed after its lease ran out.
+    """
+    updated = Recipe.objects.filter(
+        id=job['id'],
+        image=job['image'],
+        image_status=Recipe.IMAGE_PROCESSING,
+        image_claimed_at=job['image_claimed_at'],
+    ).update(
+        image_status=Recipe.IMAGE_FAILED if variants is None
+        else Recipe.IMAGE_READY,
+        image_variants=variants or {},
+        updated_at=timezone.now(),
+    )
+    if updated:
+        User.objects.bump_data_version(job['user_id'])
+
+    return bool(updated)
+
+
+def source_path(job):
+    """ Return the file system path of the job's uploaded image """
+    return recipe_image_storage.path(job['image'])
+
+
+def release(name):
+    """
+        Drop a reference to the image `name`. The file and its variants
+        are left to gc_media, a concurrent upload of the same content
+        may reuse them before its own reference is committed.
+    """
+    if name:
+        StoredFile.objects.decref(name)
@@ -0,0 +1,78 @@
+"""
+Django command to rebuild the recipe tag/ ingredient id arrays
+
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+# Recipe.tag_ids/ ingredient_ids as the link tables say they should be,
+# for the recipes with ids in [start, stop).
+EXPECTED_ARRAYS = '''
+    WITH expected AS (
+        SELECT
+            r.id,
+            COALESCE((
+                SELECT array_agg(l.tag_id ORDER BY l.tag_id)
+                FROM core_recipe_tags l WHERE l.recipe_id = r.id
+            ), '{}') AS tag_ids,
+            COALESCE((
+                SELECT array_agg(l.ingredient_id ORDER BY l.ingredient_id)
+                FROM core_recipe_ingredients l WHERE l.recipe_id = r.id
+            ), '{}') AS ingredient_ids
+        FROM core_recipe r
+        WHERE r.id >= %(start)s AND r.id < %(stop)s
+    )
+'''
+
+STALE = '''
+    r.id = e.id
+    AND (r.tag_ids, r.ingredient_ids)
+        IS DISTINCT FROM (e.tag_ids, e.ingredient_ids)
+'''
+
+UPDATE_STALE = EXPECTED_ARRAYS + f'''
+    UPDATE core_recipe r
+    SET tag_ids = e.tag_ids, ingredient_ids = e.ingredient_ids
+    FROM expected e
+    WHERE {STALE}
+'''
+
+SELECT_STALE = EXPECTED_ARRAYS + f'''
+    SELECT r.id FROM core_recipe r JOIN expected e ON {STALE}
+    ORDER BY r.id
+'''
+
+
+def id_ranges(batch_size):
+    """ Yield (start, stop) ranges of recipe ids covering the table """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(id), max(id) FROM core_recipe')
+        first, last = cursor.fetchone()
+
+    if first is None:
+        return
+
+    for start in range(first, last + 1, batch_size):
+        yield start, start + batch_size
+
+
+class Command(BaseCommand):
+    """ Django command to repair Recipe.tag_ids/ ingredient_ids in batches """
+    help = 'Rebuild the denormalized tag and ingredient id arrays of recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        updated = 0
+
+        # Short transactions per id range keep row locks brief.
+        for start, stop in id_ranges(options['batch_size']):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(UPDATE_STALE, {'start': start, 'stop': stop})
+                updated += cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated the id arrays of {updated} recipes'
+        ))
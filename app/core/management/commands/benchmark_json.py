@@ -0,0 +1,98 @@
+"""
+Django command to compare the JSON renderers and parsers
+
+"""
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from recipe.parsers import FastJSONParser
+from recipe.renderers import FastJSONRenderer, orjson
+
+
+def recipe_payload(count):
+    """ Return `count` recipes shaped like a list response page """
+    return [
+        {
+            'id': i,
+            'title': f'Recipe {i} with crème fraîche',
+            'time_minutes': i % 120,
+            'price': f'{i % 1000}.{i % 100:02d}',
+            'link': f'https://example.com/recipes/{i}',
+            'tags': [
+                {'id': i % 20 + j, 'name': f'Tag {i % 20 + j}'}
+                for j in range(3)
+            ],
+            'ingredients': [
+                {'id': i % 50 + j, 'name': f'Ingredient {i % 50 + j}'}
+                for j in range(5)
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    """ Django command timing DRF's JSON classes against the orjson ones """
+    help = 'Benchmark JSON rendering and parsing on recipe payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='100,1000,10000',
+            help='Comma separated numbers of recipes per payload',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be comma separated integers')
+
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson is not installed, both paths use the json module'
+            ))
+
+        self.stdout.write(
+            f'{"rows":>8} {"op":>6} {"drf ms":>8} {"fast ms":>8} '
+            f'{"speedup":>8}'
+        )
+        for size in sizes:
+            data = recipe_payload(size)
+            body = JSONRenderer().render(data)
+            if FastJSONRenderer().render(data) != body:
+                raise CommandError(f'Rendered output differs at {size} rows')
+
+            self._report(size, 'render', options['repeat'],
+                         lambda: JSONRenderer().render(data),
+                         lambda: FastJSONRenderer().render(data))
+            self._report(size, 'parse', options['repeat'],
+                         lambda: JSONParser().parse(BytesIO(body)),
+                         lambda: FastJSONParser().parse(BytesIO(body)))
+
+    def _report(self, size, op, repeat, drf, fast):
+        """ Print the best times of both callables """
+        drf_ms = self._time(repeat, drf)
+        fast_ms = self._time(repeat, fast)
+
+        self.stdout.write(
+            f'{size:>8} {op:>6} {drf_ms:>8.2f} {fast_ms:>8.2f} '
+            f'{drf_ms / fast_ms:>7.1f}x'
+        )
+
+    def _time(self, repeat, func):
+        """ Return the best time in ms of `func` """
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best
@@ -0,0 +1,149 @@
+"""
+Django command to compare recipe list serialization paths
+
+"""
+import json
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    Tag,
+)
+from recipe.serializers import RecipeListSerializer, RecipeSerializer
+
+
+class Rollback(Exception):
+    """ Raised to discard the generated benchmark data """
+
+
+class Command(BaseCommand):
+    """ Django command timing RecipeSerializer against the values() path """
+    help = 'Benchmark list serialization with RecipeSerializer and ' \
+           'RecipeListSerializer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='100,1000,10000',
+            help='Comma separated numbers of recipes to serialize',
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--user',
+            help='Email of a user whose recipes are used, by default '
+                 'recipes are generated and rolled back afterwards',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be comma separated integers')
+
+        if options['user']:
+            user = get_user_model().objects.filter(
+                email=options['user']
+            ).first()
+            if user is None:
+                raise CommandError(f'Unknown user {options["user"]}')
+            self._run(user, sizes, options['repeat'])
+            return
+
+        try:
+            with transaction.atomic():
+                user = self._seed(max(sizes))
+                self._run(user, sizes, options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _seed(self, count):
+        """ Create a user with `count` recipes of 3 tags/ ingredients """
+        user = get_user_model().objects.create_user(
+            f'benchmark-{time.time_ns()}@example.com',
+            None,
+        )
+        tags = Tag.objects.get_or_create_many(
+            user,
+            [f'tag{i}' for i in range(20)]
+        )
+        ingredients = Ingredient.objects.get_or_create_many(
+            user,
+            [f'ingredient{i}' for i in range(50)]
+        )
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=i % 120,
+                price=Decimal(i % 10000) / 100,
+                link=f'https://example.com/{i}',
+            )
+            for i in range(count)
+        ], batch_size=1000)
+
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe=recipe, tag=tags[(i + j) % len(tags)])
+            for i, recipe in enumerate(recipes)
+            for j in range(3)
+        ], batch_size=5000)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(i + j) % len(ingredients)],
+            )
+            for i, recipe in enumerate(recipes)
+            for j in range(3)
+        ], batch_size=5000)
+
+        return user
+
+    def _run(self, user, sizes, repeat):
+        """ Time both paths per size and print the best of `repeat` """
+        queryset = Recipe.objects.filter(user=user).order_by('-id')
+        prefetch = RecipeSerializer.Meta.prefetch_related
+        value_fields = RecipeListSerializer().value_fields
+
+        self.stdout.write(
+            f'{"rows":>8} {"serializer ms":>14} {"values ms":>10} '
+            f'{"speedup":>8}'
+        )
+        for size in sizes:
+            serializer_ms, expected = self._time(
+                repeat,
+                lambda: RecipeSerializer(
+                    queryset.prefetch_related(*prefetch)[:size],
+                    many=True,
+                ).data,
+            )
+            values_ms, data = self._time(repeat, lambda: RecipeListSerializer(
+                queryset.values(*value_fields)[:size],
+            ).data)
+
+            if json.dumps(data) != json.dumps(expected):
+                raise CommandError(f'Outputs differ at {size} rows')
+
+            self.stdout.write(
+                f'{len(data):>8} {serializer_ms:>14.1f} {values_ms:>10.1f} '
+                f'{serializer_ms / values_ms:>7.1f}x'
+            )
+
+    def _time(self, repeat, serialize):
+        """ Return the best time in ms of `serialize` and its output """
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            data = serialize()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best, data
@@ -0,0 +1,43 @@
+"""
+Django command to verify the recipe tag/ ingredient id arrays
+
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.management.commands.backfill_link_arrays import (
+    SELECT_STALE,
+    id_ranges,
+)
+
+
+class Command(BaseCommand):
+    """ Django command comparing the id arrays with the link tables """
+    help = 'Report recipes whose tag or ingredient id arrays are stale.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='Number of stale recipe ids to list',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        stale = []
+
+        for start, stop in id_ranges(options['batch_size']):
+            with connection.cursor() as cursor:
+                cursor.execute(SELECT_STALE, {'start': start, 'stop': stop})
+                stale.extend(row[0] for row in cursor.fetchall())
+
+        if stale:
+            shown = ', '.join(str(pk) for pk in stale[:options['show']])
+            raise CommandError(
+                f'{len(stale)} recipes have stale id arrays: {shown}. '
+                f'Run backfill_link_arrays to repair them.'
+            )
+
+        self.stdout.write(self.style.SUCCESS('All recipe id arrays match'))
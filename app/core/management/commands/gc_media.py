@@ -0,0 +1,125 @@
+"""
+Django command to delete recipe image files no recipe refers to
+
+"""
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import Recipe, StoredFile, recipe_image_storage
+
+
+class Command(BaseCommand):
+    """ Django command to sweep orphaned media files in chunks """
+    help = 'Delete recipe images and variants no longer referenced.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Seconds a file must be unmodified before it is deleted, '
+                 'protects uploads whose transaction has not committed',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report orphans without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        cutoff = time.time() - options['min_age']
+        files = self._walk(images.UPLOAD_DIR)
+        scanned = deleted = reclaimed = 0
+
+        while True:
+            batch = list(islice(files, options['batch_size']))
+            if not batch:
+                break
+            scanned += len(batch)
+
+            referenced = self._referenced(name for name, _ in batch)
+            for name, stat in batch:
+                if name in referenced or stat.st_mtime > cutoff:
+                    continue
+                # Uploads reusing the file touch it, stat it again so one
+                # since the walk keeps it.
+                stat = self._stat(name)
+                if stat is None or stat.st_mtime > cutoff:
+                    continue
+                if not options['dry_run']:
+                    recipe_image_storage.delete(name)
+                deleted += 1
+                reclaimed += stat.st_size
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} files. {verb} {deleted} orphans, '
+            f'{reclaimed} bytes reclaimed'
+        ))
+
+    def _walk(self, top):
+        """
+            Yield (name, stat) for every file below `top`, one directory
+            entry at a time
+        """
+        root = recipe_image_storage.location
+        pending = [os.path.join(root, top)]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except FileNotFoundError:
+                continue
+
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        name = os.path.relpath(entry.path, root)
+                        yield name.replace(os.sep, '/'), entry.stat()
+
+    def _stat(self, name):
+        """ Return the stat of the file `name`, None if it is gone """
+        try:
+            return os.stat(recipe_image_storage.path(name))
+        except FileNotFoundError:
+            return None
+
+    def _source(self, name):
+        """
+            Return the image a file belongs to. Variants of sizes no longer
+            configured belong to the image named by their hash prefix.
+        """
+        source = images.source_name(name)
+        if source is None:
+            shards, filename = os.path.split(
+                os.path.relpath(name, images.VARIANT_DIR)
+            )
+            source = os.path.normpath(os.path.join(
+                images.UPLOAD_DIR, shards, filename.split('-', 1)[0]
+            ))
+
+        return source
+
+    def _referenced(self, names):
+        """
+            Return the subset of `names` still in use by some recipe.
+            Recipes are checked besides the reference counts, so a count
+            that drifted never costs a live image.
+        """
+        sources = {name: self._source(name) for name in names}
+        wanted = set(sources.values())
+        used = set(StoredFile.objects.filter(
+            name__in=wanted
+        ).values_list('name', flat=True))
+        used.update(Recipe.objects.filter(
+            image__in=wanted
+        ).values_list('image', flat=True))
+
+        return {name for name, source in sources.items() if source in used}
@@ -0,0 +1,322 @@
+"""
+Django command to bulk import recipes from CSV or JSON lines
+
+"""
+import csv
+import io
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import ImportCheckpoint, UserRecipeStats
+
+STAGING_TABLES = '''
+    CREATE TEMP TABLE IF NOT EXISTS import_recipe (
+        row_no bigint PRIMARY KEY,
+        title text NOT NULL,
+        description text NOT NULL,
+        time_minutes integer NOT NULL,
+        price numeric(5, 2) NOT NULL,
+        link text NOT NULL,
+        recipe_id bigint
+    );
+    CREATE TEMP TABLE IF NOT EXISTS import_tag (
+        row_no bigint NOT NULL,
+        name text NOT NULL
+    );
+    CREATE TEMP TABLE IF NOT EXISTS import_ingredient (
+        row_no bigint NOT NULL,
+        name text NOT NULL
+    );
+    TRUNCATE import_recipe, import_tag, import_ingredient;
+'''
+
+# Recipe ids are drawn up front so staged rows can be linked to tags and
+# ingredients without relying on the order of INSERT ... RETURNING.
+LOAD_RECIPES = '''
+    UPDATE import_recipe
+    SET recipe_id = nextval(pg_get_serial_sequence('core_recipe', 'id'));
+
+    INSERT INTO core_recipe (
+        id, user_id, title, description, time_minutes, price, link,
+        updated_at, image_status, image_variants, image_attempts, tag_ids,
+        ingredient_ids
+    )
+    SELECT
+        recipe_id, %(user_id)s, title, description, time_minutes, price,
+        link, now(), 'none', '{}'::jsonb, 0, '{}', '{}'
+    FROM import_recipe;
+'''
+
+LOAD_ATTRS = '''
+    INSERT INTO core_{attr} (user_id, name, updated_at)
+    SELECT DISTINCT %(user_id)s, name, now() FROM import_{attr}
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO core_recipe_{attr}s (recipe_id, {attr}_id)
+    SELECT DISTINCT r.recipe_id, a.id
+    FROM import_{attr} s
+    JOIN import_recipe r ON r.row_no = s.row_no
+    JOIN core_{attr} a ON a.user_id = %(user_id)s AND a.name = s.name
+    ON CONFLICT DO NOTHING;
+'''
+
+
+class Command(BaseCommand):
+    """ Django command to import recipes with COPY and set based SQL """
+    help = 'Bulk import recipes for a user from a CSV or JSON lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON lines (.jsonl) file')
+        parser.add_argument('--user', required=True, help='Owner email')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format, guessed from the file extension by default',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Name under which imported rows are recorded in the '
+                 'database, to resume an import',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+
+        path = options['path']
+        fmt = options['format'] or (
+            'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+        )
+        checkpoint = options['checkpoint']
+        done = self._read_checkpoint(checkpoint, path)
+        imported = skipped = 0
+        started = time.monotonic()
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            rows = enumerate(self._read_rows(stream, fmt))
+            rows = islice(rows, done, None)
+
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+
+                records = []
+                for row_no, row in batch:
+                    record = self._clean(row)
+                    if record is None:
+                        skipped += 1
+                        self.stderr.write(f'Skipping invalid row {row_no + 1}')
+                    else:
+                        records.append((row_no, record))
+
+                done = batch[-1][0] + 1
+                # Each committed batch is visible at once, so cached lists
+                # must not outlive it. The checkpoint commits with the rows
+                # so a resumed import never loads them twice.
+                with transaction.atomic():
+                    self._load(user, records)
+                    get_user_model().objects.bump_data_version(user.pk)
+                    self._write_checkpoint(checkpoint, path, done)
+
+                imported += len(records)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{imported} recipes imported '
+                    f'({imported / elapsed:.0f} rows/sec)'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes, skipped {skipped} rows'
+        ))
+
+    def _read_rows(self, stream, fmt):
+        """
+            Yield input rows, dicts for CSV and unparsed lines for JSONL
+            so a malformed line is skipped like any invalid row
+        """
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+            return
+
+        for line in stream:
+            if line.strip():
+                yield line
+
+    def _text(self, value):
+        """ Return a field as a string, numbers are taken as written """
+        if value is None:
+            return ''
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str) or '\x00' in value:
+            raise ValueError(value)
+
+        return value
+
+    def _integer(self, value):
+        """ Return a field as an int that fits an integer column """
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif isinstance(value, str):
+            value = int(value.strip())
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(value)
+        if not -2 ** 31 <= value < 2 ** 31:
+            raise ValueError(value)
+
+        return value
+
+    def _price(self, value):
+        """ Return a field as a price that fits the price column """
+        if isinstance(value, bool):
+            raise ValueError(value)
+        price = Decimal(self._text(value).strip())
+        if not price.is_finite() or abs(price) >= 1000:
+            raise ValueError(value)
+
+        return price.quantize(Decimal('0.01'))
+
+    def _names(self, value):
+        """ Return attribute names from a list or a '|' separated string """
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split('|')
+        if not isinstance(value, list):
+            raise ValueError(value)
+
+        names = [
+            self._text(item.get('name') if isinstance(item, dict) else item)
+            for item in value
+        ]
+        return [name.strip() for name in names if name.strip()]
+
+    def _clean(self, row):
+        """
+            Return a validated record for a row, None if invalid. Every
+            field is checked here, so a bad row cannot fail its batch.
+        """
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)
+            if not isinstance(row, dict):
+                return None
+
+            record = {
+                'title': self._text(row.get('title')).strip(),
+                'description': self._text(row.get('description')),
+                'time_minutes': self._integer(row['time_minutes']),
+                'price': self._price(row['price']),
+                'link': self._text(row.get('link')),
+                'tags': self._names(row.get('tags')),
+                'ingredients': self._names(row.get('ingredients')),
+            }
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            return None
+
+        names = record['tags'] + record['ingredients'] + [record['title']]
+        if not record['title'] or any(
+            len(name) > 255 for name in names + [record['link']]
+        ):
+            return None
+
+        return record
+
+    def _copy(self, cursor, table, columns, rows):
+        """ Stream rows into a staging table with COPY """
+        buffer = io.StringIO()
+        # Quoting keeps empty strings apart from NULL.
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {table} ({", ".join(columns)}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+    def _load(self, user, records):
+        """ Stage a batch and move it into the recipe tables """
+        params = {'user_id': user.pk}
+
+        with connection.cursor() as cursor:
+            cursor.execute(STAGING_TABLES)
+            self._copy(
+                cursor,
+                'import_recipe',
+                [
+                    'row_no', 'title', 'description', 'time_minutes',
+                    'price', 'link',
+                ],
+                (
+                    (
+                        row_no, r['title'], r['description'],
+                        r['time_minutes'], r['price'], r['link'],
+                    )
+                    for row_no, r in records
+                ),
+            )
+            for attr in ('tag', 'ingredient'):
+                self._copy(
+                    cursor,
+                    f'import_{attr}',
+                    ['row_no', 'name'],
+                    (
+                        (row_no, name)
+                        for row_no, r in records
+                        for name in r[f'{attr}s']
+                    ),
+                )
+
+            # Temp tables are never auto-analyzed, plan joins on real sizes.
+            cursor.execute(
+                'ANALYZE import_recipe, import_tag, import_ingredient'
+            )
+            cursor.execute(LOAD_RECIPES, params)
+            for attr in ('tag', 'ingredient'):
+                cursor.execute(LOAD_ATTRS.format(attr=attr), params)
+
+            # The SQL above skips the signals maintaining the stats.
+            cursor.execute('SELECT recipe_id FROM import_recipe')
+            recipe_ids = [row[0] for row in cursor.fetchall()]
+
+        UserRecipeStats.objects.record_change(
+            {},
+            UserRecipeStats.objects.summarize(recipe_ids),
+        )
+
+    def _read_checkpoint(self, checkpoint, path):
+        """ Return the number of input rows already imported """
+        if not checkpoint:
+            return 0
+
+        state = ImportCheckpoint.objects.filter(name=checkpoint).first()
+        if state is None:
+            return 0
+        if state.path != os.path.abspath(path):
+            raise CommandError(f'Checkpoint {checkpoint} is for another file')
+
+        self.stdout.write(f'Resuming after row {state.rows}')
+        return state.rows
+
+    def _write_checkpoint(self, checkpoint, path, rows):
+        """ Record the number of input rows imported """
+        if not checkpoint:
+            return
+
+        ImportCheckpoint.objects.update_or_create(
+            name=checkpoint,
+            defaults={'path': os.path.abspath(path), 'rows': rows},
+        )
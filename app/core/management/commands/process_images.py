@@ -0,0 +1,104 @@
+"""
+Django command to generate resized variants of uploaded recipe images
+
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import recipe_image_storage
+
+
+class Command(BaseCommand):
+    """ Django command to work through the recipe image queue """
+    help = 'Resize queued recipe images into thumbnail/medium/large variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Size of the process pool, 0 resizes in this process',
+        )
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling',
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument(
+            '--lease',
+            type=float,
+            default=images.CLAIM_LEASE.total_seconds(),
+            help='Seconds after which a job still processing is reclaimed',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=images.MAX_ATTEMPTS,
+            help='Claims of a job before it is marked as failed',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        workers = options['workers']
+        pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+        lease = timedelta(seconds=options['lease'])
+        processed = failed = 0
+
+        try:
+            while True:
+                jobs = images.claim_pending(
+                    options['batch_size'], lease, options['max_attempts']
+                )
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                for job, variants, error in self._process(pool, jobs):
+                    images.finish(job, variants)
+                    if error is not None:
+                        failed += 1
+                        self.stderr.write(
+                            f'Failed to process image of recipe '
+                            f'{job["id"]}: {error}'
+                        )
+                    else:
+                        processed += 1
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} images, {failed} failed'
+        ))
+
+    def _process(self, pool, jobs):
+        """ Return (job, variants, error) triples for a batch of jobs """
+        sizes = images.get_variant_sizes()
+        root = recipe_image_storage.location
+        args = [
+            (images.source_path(job), root, job['image'], sizes)
+            for job in jobs
+        ]
+
+        if pool is None:
+            results = [self._call(images.make_variants, *arg) for arg in args]
+        else:
+            futures = [pool.submit(images.make_variants, *arg) for arg in args]
+            results = [self._call(future.result) for future in futures]
+
+        return [(job, *result) for job, result in zip(jobs, results)]
+
+    def _call(self, func, *args):
+        """ Return a (result, error) pair for func(*args) """
+        try:
+            return func(*args), None
+        except Exception as exc:
+            return None, exc
@@ -0,0 +1,45 @@
+"""
+Django command to recompute the per user recipe statistics
+
+"""
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import UserRecipeStats
+
+
+class Command(BaseCommand):
+    """ Django command to repair UserRecipeStats drift in batches of users """
+    help = 'Recompute the recipe statistics of every user, or of one user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of a single user to rebuild')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Users rebuilt per transaction',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'Unknown user {options["user"]}')
+
+        user_ids = users.values_list('pk', flat=True).iterator()
+        rebuilt = 0
+        while True:
+            batch = list(islice(user_ids, options['batch_size']))
+            if not batch:
+                break
+            UserRecipeStats.objects.rebuild(batch)
+            rebuilt += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the recipe stats of {rebuilt} users'
+        ))
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-17 03:59
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """ Merge tags and ingredients sharing a (user, name) pair """
+    Recipe = apps.get_model('core', 'Recipe')
+
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        Model = apps.get_model('core', model_name)
+        Through = getattr(Recipe, relation).through
+        target = f'{model_name.lower()}_id'
+
+        duplicates = Model.objects.values('user', 'name').annotate(
+            keep_id=Min('id'),
+            total=Count('id'),
+        ).filter(total__gt=1)
+
+        for dup in duplicates:
+            drop_ids = list(
+                Model.objects.filter(
+                    user=dup['user'],
+                    name=dup['name'],
+                ).exclude(id=dup['keep_id']).values_list('id', flat=True)
+            )
+            recipe_ids = set(
+                Through.objects.filter(
+                    **{f'{target}__in': drop_ids}
+                ).values_list('recipe_id', flat=True)
+            )
+            recipe_ids -= set(
+                Through.objects.filter(
+                    **{target: dup['keep_id']}
+                ).values_list('recipe_id', flat=True)
+            )
+            Through.objects.bulk_create([
+                Through(recipe_id=recipe_id, **{target: dup['keep_id']})
+                for recipe_id in recipe_ids
+            ])
+            Model.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
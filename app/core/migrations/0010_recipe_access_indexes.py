@@ -0,0 +1,98 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_user_id_index'),
+    ]
+
+    operations = [
+        # The auto-created through tables become explicit models so they
+        # can declare indexes. Tables and columns are unchanged.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RecipeTag',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recipe')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tag')),
+                    ],
+                    options={
+                        'db_table': 'core_recipe_tags',
+                        'unique_together': {('recipe', 'tag')},
+                    },
+                ),
+                migrations.CreateModel(
+                    name='RecipeIngredient',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recipe')),
+                        ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.ingredient')),
+                    ],
+                    options={
+                        'db_table': 'core_recipe_ingredients',
+                        'unique_together': {('recipe', 'ingredient')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='tags',
+                    field=models.ManyToManyField(through='core.RecipeTag', to='core.Tag'),
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='ingredients',
+                    field=models.ManyToManyField(through='core.RecipeIngredient', to='core.Ingredient'),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipetag',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.recipe'),
+        ),
+        migrations.AlterField(
+            model_name='recipetag',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.tag'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.recipe'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='ingredient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.ingredient'),
+        ),
+        migrations.AddIndex(
+            model_name='recipetag',
+            index=models.Index(fields=['tag', 'recipe'], name='core_recipetag_tag_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['ingredient', 'recipe'], name='core_recipeing_ing_recipe_idx'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='tag',
+            name='core_tag_unique_user_name',
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), include=('id',), name='core_tag_unique_user_name'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='ingredient',
+            name='core_ingredient_unique_user_name',
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), include=('id',), name='core_ingredient_unique_user_name'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recipe_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
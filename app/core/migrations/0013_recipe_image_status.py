@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:16
+
+from django.db import migrations, models
+
+
+def queue_existing_images(apps, schema_editor):
+    """ Queue variant generation for images uploaded before the worker """
+    Recipe = apps.get_model('core', 'Recipe')
+    Recipe.objects.exclude(image='').exclude(image__isnull=True).update(
+        image_status='pending',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('image_status', 'pending')), fields=['id'], name='core_recipe_image_pending_idx'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
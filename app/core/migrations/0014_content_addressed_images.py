@@ -0,0 +1,67 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:19
+
+import core.models
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rehash_images(apps, schema_editor):
+    """
+        Move existing images to their content addressed names, merging
+        duplicates, and count the references to each stored file
+    """
+    Recipe = apps.get_model('core', 'Recipe')
+    StoredFile = apps.get_model('core', 'StoredFile')
+    storage = Recipe._meta.get_field('image').storage
+
+    recipes = Recipe.objects.exclude(image='').exclude(image__isnull=True)
+    for recipe in recipes.iterator():
+        old = recipe.image.name
+        if not storage.exists(old):
+            continue
+
+        with storage.open(old) as f:
+            new = storage.save(old, f)
+        if new == old:
+            continue
+
+        storage.delete(old)
+        for variant in recipe.image_variants.values():
+            storage.delete(variant)
+        # Variants are named after the image, queue them again.
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image=new,
+            image_status='pending',
+            image_variants={},
+        )
+
+    StoredFile.objects.all().delete()
+    StoredFile.objects.bulk_create(
+        StoredFile(name=row['image'], refcount=row['refs'])
+        for row in recipes.values('image').annotate(refs=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_image_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.RunPython(rehash_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# The column is kept out of the model so recipes never load or write it,
+# the trigger below is its only writer.
+SEARCH_VECTOR = '''
+    setweight(to_tsvector('pg_catalog.english', coalesce({row}title, '')), 'A')
+    || setweight(
+        to_tsvector('pg_catalog.english', coalesce({row}description, '')),
+        'B'
+    )
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                'ALTER TABLE core_recipe ADD COLUMN search_vector tsvector',
+                f'''
+                CREATE FUNCTION core_recipe_search_vector_update()
+                RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+                ''',
+                '''
+                CREATE TRIGGER core_recipe_search_vector_trigger
+                BEFORE INSERT OR UPDATE OF title, description ON core_recipe
+                FOR EACH ROW EXECUTE FUNCTION core_recipe_search_vector_update()
+                ''',
+                f'UPDATE core_recipe SET search_vector = '
+                f'{SEARCH_VECTOR.format(row="")}',
+                'CREATE INDEX core_recipe_search_idx ON core_recipe '
+                'USING GIN (search_vector)',
+            ],
+            reverse_sql=[
+                'DROP TRIGGER core_recipe_search_vector_trigger ON core_recipe',
+                'DROP FUNCTION core_recipe_search_vector_update()',
+                'ALTER TABLE core_recipe DROP COLUMN search_vector',
+            ],
+        ),
+    ]
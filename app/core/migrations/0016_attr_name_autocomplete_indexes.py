@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:34
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+
+# pg_trgm and btree_gin ship with the standard contrib package. Where
+# they are missing autocomplete only matches by prefix.
+TRIGRAM_INDEXES = '''
+DO $$
+BEGIN
+    IF (
+        SELECT count(*) FROM pg_available_extensions
+        WHERE name IN ('pg_trgm', 'btree_gin')
+    ) = 2 THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+        CREATE INDEX IF NOT EXISTS core_tag_name_trgm_idx
+            ON core_tag USING GIN (user_id, name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS core_ingredient_name_trgm_idx
+            ON core_ingredient USING GIN (user_id, name gin_trgm_ops);
+    END IF;
+END
+$$
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.expressions.F('user'), django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper('name'), 'C'), name='core_ingred_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(django.db.models.expressions.F('user'), django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper('name'), 'C'), name='core_tag_name_prefix_idx'),
+        ),
+        migrations.RunSQL(
+            sql=TRIGRAM_INDEXES,
+            reverse_sql=[
+                'DROP INDEX IF EXISTS core_tag_name_trgm_idx',
+                'DROP INDEX IF EXISTS core_ingredient_name_trgm_idx',
+            ],
+        ),
+    ]
@@ -0,0 +1,104 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# Statement level triggers read the changed links from transition tables,
+# so bulk_create and the raw SQL import keep the arrays in step as well.
+# A transition table trigger handles a single event, hence one per event.
+LINK_ARRAY = '''
+    COALESCE((
+        SELECT array_agg(l.{attr}_id ORDER BY l.{attr}_id)
+        FROM core_recipe_{attr}s l
+        WHERE l.recipe_id = core_recipe.id
+    ), '{{}}')
+'''
+
+SYNC_FUNCTION = '''
+    CREATE FUNCTION core_recipe_{attr}_ids_sync()
+    RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE core_recipe SET {attr}_ids = {array}
+            WHERE id IN (SELECT recipe_id FROM new_links);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE core_recipe SET {attr}_ids = {array}
+            WHERE id IN (SELECT recipe_id FROM old_links);
+        ELSE
+            UPDATE core_recipe SET {attr}_ids = {array}
+            WHERE id IN (
+                SELECT recipe_id FROM new_links
+                UNION SELECT recipe_id FROM old_links
+            );
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+TRIGGERS = {
+    'insert': 'REFERENCING NEW TABLE AS new_links',
+    'delete': 'REFERENCING OLD TABLE AS old_links',
+    'update': 'REFERENCING NEW TABLE AS new_links OLD TABLE AS old_links',
+}
+
+
+def sync_sql(attr):
+    """ Return the statements creating the triggers of a link table """
+    sql = [SYNC_FUNCTION.format(attr=attr, array=LINK_ARRAY.format(attr=attr))]
+    for event, referencing in TRIGGERS.items():
+        sql.append(
+            f'CREATE TRIGGER core_recipe_{attr}_ids_{event} '
+            f'AFTER {event.upper()} ON core_recipe_{attr}s {referencing} '
+            f'FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_{attr}_ids_sync()'
+        )
+    sql.append(
+        f'UPDATE core_recipe SET {attr}_ids = {LINK_ARRAY.format(attr=attr)} '
+        f'WHERE EXISTS (SELECT FROM core_recipe_{attr}s l '
+        f'WHERE l.recipe_id = core_recipe.id)'
+    )
+
+    return sql
+
+
+def drop_sql(attr):
+    """ Return the statements dropping the triggers of a link table """
+    return [
+        f'DROP TRIGGER core_recipe_{attr}_ids_{event} ON core_recipe_{attr}s'
+        for event in TRIGGERS
+    ] + [f'DROP FUNCTION core_recipe_{attr}_ids_sync()']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_attr_name_autocomplete_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunSQL(
+            # Run the deferred checks queued by the backfill, the indexes
+            # below can't be built on a table with pending trigger events.
+            sql=sync_sql('tag') + sync_sql('ingredient') + [
+                'SET CONSTRAINTS ALL IMMEDIATE',
+            ],
+            reverse_sql=drop_sql('tag') + drop_sql('ingredient'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tag_ids'], name='core_recipe_tag_ids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ingredient_ids'], name='core_recipe_ingred_ids_idx'),
+        ),
+    ]
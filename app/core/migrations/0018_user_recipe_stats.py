@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:03
+
+import core.models
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Fills the table for users who already have recipes, later changes are
+# recorded as they happen. Buckets follow core.models.PRICE_BUCKETS.
+POPULATE = '''
+    WITH links AS (
+        SELECT user_id, 'tag' AS kind, link_id, count(*) AS n
+        FROM core_recipe, unnest(tag_ids) AS link_id
+        GROUP BY user_id, link_id
+        UNION ALL
+        SELECT user_id, 'ingredient', link_id, count(*)
+        FROM core_recipe, unnest(ingredient_ids) AS link_id
+        GROUP BY user_id, link_id
+    )
+    INSERT INTO core_userrecipestats (
+        user_id, recipe_count, total_time_minutes, total_price,
+        price_buckets, tag_counts, ingredient_counts, updated_at
+    )
+    SELECT
+        r.user_id,
+        count(*),
+        sum(r.time_minutes),
+        sum(r.price),
+        ARRAY[
+            count(*) FILTER (WHERE r.price < 5),
+            count(*) FILTER (WHERE r.price >= 5 AND r.price < 10),
+            count(*) FILTER (WHERE r.price >= 10 AND r.price < 20),
+            count(*) FILTER (WHERE r.price >= 20 AND r.price < 50),
+            count(*) FILTER (WHERE r.price >= 50)
+        ],
+        COALESCE((
+            SELECT jsonb_object_agg(l.link_id, l.n) FROM links l
+            WHERE l.user_id = r.user_id AND l.kind = 'tag'
+        ), '{}'),
+        COALESCE((
+            SELECT jsonb_object_agg(l.link_id, l.n) FROM links l
+            WHERE l.user_id = r.user_id AND l.kind = 'ingredient'
+        ), '{}'),
+        now()
+    FROM core_recipe r
+    GROUP BY r.user_id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipe_link_arrays'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to='core.user')),
+                ('recipe_count', models.BigIntegerField(default=0)),
+                ('total_time_minutes', models.BigIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('price_buckets', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=core.models.empty_price_buckets, size=None)),
+                ('tag_counts', models.JSONField(default=dict)),
+                ('ingredient_counts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(POPULATE, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,108 @@
+from django.db import migrations
+
+# The arrays are updated by the links a statement added or removed, not
+# recomputed. Under READ COMMITTED an UPDATE waiting on a concurrent one
+# re-reads the row it then changes, so both transactions' links are kept,
+# while a recomputing subquery only saw the statement's snapshot.
+ADD_LINKS = '''
+    UPDATE core_recipe SET {attr}_ids = ARRAY(
+        SELECT DISTINCT link_id
+        FROM unnest({attr}_ids || links.ids) AS link_id
+        ORDER BY link_id
+    )
+    FROM (
+        SELECT recipe_id, array_agg({attr}_id) AS ids
+        FROM new_links GROUP BY recipe_id
+    ) links
+    WHERE core_recipe.id = links.recipe_id;
+'''
+
+REMOVE_LINKS = '''
+    UPDATE core_recipe SET {attr}_ids = ARRAY(
+        SELECT link_id FROM unnest({attr}_ids) AS link_id
+        WHERE link_id <> ALL (links.ids)
+        ORDER BY link_id
+    )
+    FROM (
+        SELECT recipe_id, array_agg({attr}_id) AS ids
+        FROM old_links GROUP BY recipe_id
+    ) links
+    WHERE core_recipe.id = links.recipe_id;
+'''
+
+DELTA_FUNCTION = '''
+    CREATE OR REPLACE FUNCTION core_recipe_{attr}_ids_sync()
+    RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            {remove}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {add}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+# The function of 0017_recipe_link_arrays, restored on reverse.
+RECOMPUTE_ARRAY = '''
+    COALESCE((
+        SELECT array_agg(l.{attr}_id ORDER BY l.{attr}_id)
+        FROM core_recipe_{attr}s l
+        WHERE l.recipe_id = core_recipe.id
+    ), '{{}}')
+'''
+
+RECOMPUTE_FUNCTION = '''
+    CREATE OR REPLACE FUNCTION core_recipe_{attr}_ids_sync()
+    RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE core_recipe SET {attr}_ids = {array}
+            WHERE id IN (SELECT recipe_id FROM new_links);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE core_recipe SET {attr}_ids = {array}
+            WHERE id IN (SELECT recipe_id FROM old_links);
+        ELSE
+            UPDATE core_recipe SET {attr}_ids = {array}
+            WHERE id IN (
+                SELECT recipe_id FROM new_links
+                UNION SELECT recipe_id FROM old_links
+            );
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+
+def delta_sql(attr):
+    """ Return the statement replacing a link table's trigger function """
+    return DELTA_FUNCTION.format(
+        attr=attr,
+        remove=REMOVE_LINKS.format(attr=attr),
+        add=ADD_LINKS.format(attr=attr),
+    )
+
+
+def recompute_sql(attr):
+    """ Return the statement restoring the recomputing trigger function """
+    return RECOMPUTE_FUNCTION.format(
+        attr=attr,
+        array=RECOMPUTE_ARRAY.format(attr=attr),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_user_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[delta_sql('tag'), delta_sql('ingredient')],
+            reverse_sql=[recompute_sql('tag'), recompute_sql('ingredient')],
+        ),
+    ]
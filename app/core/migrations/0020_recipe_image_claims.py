@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:27
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def start_existing_leases(apps, schema_editor):
+    """ Let jobs claimed before leases existed be reclaimed in turn """
+    Recipe = apps.get_model('core', 'Recipe')
+    Recipe.objects.filter(image_status='processing').update(
+        image_claimed_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_link_array_deltas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('image_status', 'processing')), fields=['image_claimed_at'], name='core_recipe_image_claimed_idx'),
+        ),
+        migrations.RunPython(start_existing_leases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['image'], name='core_recipe_image_idx'),
+        ),
+    ]
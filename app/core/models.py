@@ -1,23 +1,45 @@
 """
     Database Models
 """
-import uuid
+import json
 import os
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+from functools import lru_cache
 
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramSimilarity,
+)
+from django.db import connection, connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Collate, Upper
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin
 )
 
+from core.storage import ContentAddressedStorage
+
+
 def recipe_image_file_path(instance, filename):
-    """ Generate file path for new image """
+    """
+        Generate file path for new image, the storage replaces the name
+        with the content hash
+    """
     ext = os.path.splitext(filename)[1]
-    filename = f'{uuid.uuid4()}{ext}'
 
-    return os.path.join('uploads', 'recipe', filename)
+    return os.path.join('uploads', 'recipe', f'image{ext}')
+
+
+recipe_image_storage = ContentAddressedStorage()
 
 class UserManager(BaseUserManager):
     """
@@ -45,6 +67,19 @@ class UserManager(BaseUserManager):
 
         return user
 
+    def get_data_version(self, user_id):
+        """ Return the version of the user's recipe data """
+        return self.filter(pk=user_id).values_list(
+            'data_version',
+            flat=True
+        ).first()
+
+    def bump_data_version(self, user_id):
+        """ Mark the user's recipe data as changed """
+        self.filter(pk=user_id).update(
+            data_version=models.F('data_version') + 1
+        )
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     """
@@ -54,12 +89,190 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped on every change to the user's recipes, tags or ingredients.
+    data_version = models.PositiveBigIntegerField(default=0)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
 
+@lru_cache(maxsize=None)
+def has_extension(name, using='default'):
+    """ Return whether the database has the extension `name` installed """
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+        return cursor.fetchone() is not None
+
+
+class CappedCount(models.Subquery):
+    """ Count the rows of a subquery, sliced to cap the count """
+    template = '(SELECT count(*) FROM (%(subquery)s) capped)'
+    output_field = models.IntegerField()
+
+
+class RecipeAttrQuerySet(models.QuerySet):
+    """ Queries over per user recipe attributes """
+    # Fuzzy matching needs whole trigrams to be selective.
+    trigram_min_length = 3
+    # Usage only breaks ties, counting beyond this adds cost, not order.
+    usage_max_count = 500
+
+    def autocomplete(self, text, limit, pool=None):
+        """
+            Return at most `limit` attributes whose name starts with or,
+            with pg_trgm installed, resembles `text`. Ranked by
+            similarity, then by how many recipes use them. Only a pool of
+            the first prefix and most similar matches is ranked, so short
+            inputs matching everything stay cheap.
+        """
+        pool = pool or limit * 3
+        prefix_matches = self.filter(name__istartswith=text).order_by(
+            Collate(Upper('name'), 'C')
+        )
+        candidates = models.Q(pk__in=prefix_matches.values('pk')[:pool])
+        ordering = ['-usage', 'name']
+        queryset = self
+
+        use_trigrams = (
+            len(text) >= self.trigram_min_length
+            and has_extension('pg_trgm', self.db)
+        )
+        if use_trigrams:
+            similarity = TrigramSimilarity('name', text)
+            similar_matches = self.filter(
+                name__trigram_similar=text
+            ).annotate(similarity=similarity).order_by('-similarity')
+            candidates |= models.Q(
+                pk__in=similar_matches.values('pk')[:pool]
+            )
+            ordering.insert(0, '-similarity')
+            queryset = queryset.annotate(similarity=similarity)
+
+        links = self._recipe_links().values('pk')[:self.usage_max_count]
+
+        return queryset.filter(candidates).annotate(
+            usage=CappedCount(links)
+        ).order_by(*ordering)[:limit]
+
+    def assigned(self):
+        """ Return the attributes used by at least one recipe """
+        return self.filter(models.Exists(self._recipe_links()))
+
+    def with_recipe_count(self):
+        """ Annotate how many recipes use each attribute """
+        return self.annotate(
+            recipe_count=CappedCount(self._recipe_links().values('pk'))
+        )
+
+    def _recipe_links(self):
+        """ Return the recipe links of the outer query's attribute """
+        field = self.model._meta.model_name
+        return self.model.recipe_set.through.objects.filter(
+            **{field: models.OuterRef('pk')}
+        )
+
+
+class RecipeAttrManager(models.Manager.from_queryset(RecipeAttrQuerySet)):
+    """
+        manager for per user recipe attributes (tags, ingredients)
+    """
+
+    def get_or_create_many(self, user, names):
+        """ Return objects for names, creating missing ones in bulk """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+
+        objs = {
+            obj.name: obj
+            for obj in self.filter(user=user, name__in=names)
+        }
+        missing = [name for name in names if name not in objs]
+
+        if missing:
+            # Another worker may insert the same names concurrently, the
+            # unique constraint turns those rows into no-ops.
+            self.bulk_create(
+                [self.model(user=user, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            objs.update(
+                (obj.name, obj)
+                for obj in self.filter(user=user, name__in=missing)
+            )
+
+        return [objs[name] for name in names]
+
+
+class StoredFileManager(models.Manager):
+    """ Manager maintaining reference counts of shared media files """
+
+    def incref(self, name):
+        """ Record one more reference to the file `name` """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {self.model._meta.db_table} AS f
+                    (name, refcount, created_at)
+                VALUES (%s, 1, now())
+                ON CONFLICT (name)
+                DO UPDATE SET refcount = f.refcount + 1
+                ''',
+                [name]
+            )
+
+    def decref(self, name):
+        """
+            Drop one reference to the file `name` and return True if
+            nothing references it anymore
+        """
+        self.filter(name=name).update(refcount=models.F('refcount') - 1)
+        deleted, _ = self.filter(name=name, refcount__lte=0).delete()
+
+        return bool(deleted)
+
+
+class StoredFile(models.Model):
+    """ Reference count of a content addressed media file """
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StoredFileManager()
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeQuerySet(models.QuerySet):
+    """ Queries over recipes """
+
+    def search(self, text, max_matches=None):
+        """
+            Return recipes matching the web search style query `text`,
+            annotated with their rank. Uses the trigger maintained
+            search_vector column and its GIN index. With max_matches only
+            the newest matches are ranked, bounding the cost of broad terms.
+        """
+        query = SearchQuery(text, config='english', search_type='websearch')
+        # Unqualified so it binds to the innermost recipe table when this
+        # queryset is used as a subquery, no other table has the column.
+        vector = RawSQL('search_vector', [], output_field=SearchVectorField())
+
+        matches = self.alias(search_vector=vector).filter(search_vector=query)
+        if max_matches is not None:
+            matches = self.filter(
+                pk__in=matches.order_by('-pk').values('pk')[:max_matches]
+            )
+
+        # ts_rank() is a real, which does not survive the round trip
+        # through the pagination cursor. A double compares exactly.
+        return matches.annotate(
+            rank=Cast(SearchRank(vector, query), models.FloatField())
+        )
+
+
 class Recipe(models.Model):
     """ Recipe Object """
     user = models.ForeignKey(
@@ -71,13 +284,108 @@ class Recipe(models.Model):
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
-    tags = models.ManyToManyField('Tag')
-    ingredients = models.ManyToManyField('Ingredient')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    tags = models.ManyToManyField('Tag', through='RecipeTag')
+    ingredients = models.ManyToManyField(
+        'Ingredient',
+        through='RecipeIngredient',
+    )
+    IMAGE_NONE = 'none'
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_NONE, 'No image'),
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_PROCESSING, 'Processing'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    ]
+
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage,
+    )
+    # Resized copies of the image, filled in by the process_images worker.
+    image_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_NONE,
+    )
+    image_variants = models.JSONField(default=dict, blank=True)
+    # When a worker claimed the image and how often it was claimed, so
+    # jobs of a worker that died can be handed out again.
+    image_claimed_at = models.DateTimeField(null=True, blank=True)
+    image_attempts = models.PositiveSmallIntegerField(default=0)
+    # Also touched when the recipe's tags or ingredients change.
+    updated_at = models.DateTimeField(auto_now=True)
+    # The table also has a search_vector column over title and description,
+    # maintained by a trigger, see RecipeQuerySet.search().
+    # Sorted ids of the linked tags and ingredients, kept in step with the
+    # link tables by triggers so bulk writes stay consistent too.
+    tag_ids = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        blank=True,
+        editable=False,
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        blank=True,
+        editable=False,
+    )
+    link_array_fields = ('tag_ids', 'ingredient_ids')
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs the per-user keyset pagination on -id.
+            models.Index(
+                fields=['user', '-id'],
+                name='core_recipe_user_id_idx',
+            ),
+            # Lets the image worker find queued jobs without a full scan.
+            models.Index(
+                fields=['id'],
+                name='core_recipe_image_pending_idx',
+                condition=models.Q(image_status='pending'),
+            ),
+            # Lets gc_media check whether a stored file is still in use.
+            models.Index(fields=['image'], name='core_recipe_image_idx'),
+            # Finds claimed jobs whose lease ran out.
+            models.Index(
+                fields=['image_claimed_at'],
+                name='core_recipe_image_claimed_idx',
+                condition=models.Q(image_status='processing'),
+            ),
+            # Containment (@>) and overlap (&&) filters on the links.
+            GinIndex(fields=['tag_ids'], name='core_recipe_tag_ids_idx'),
+            GinIndex(
+                fields=['ingredient_ids'],
+                name='core_recipe_ingred_ids_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """ Save, leaving the link arrays to the triggers that own them """
+        if not (self._state.adding or args or kwargs.get('force_insert')) \
+                and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.link_array_fields
+            ]
+
+        super().save(*args, **kwargs)
+
 class Tag(models.Model):
     """ Tags for filtering recipes """
     name = models.CharField(max_length=255)
@@ -85,6 +393,27 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            # Covers the per-user listing ordered by name.
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                include=['id'],
+                name='core_tag_unique_user_name',
+            ),
+        ]
+        indexes = [
+            # Prefix autocomplete, in the order it walks candidates.
+            models.Index(
+                'user',
+                Collate(Upper('name'), 'C'),
+                name='core_tag_name_prefix_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -96,6 +425,392 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            # Covers the per-user listing ordered by name.
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                include=['id'],
+                name='core_ingredient_unique_user_name',
+            ),
+        ]
+        indexes = [
+            # Prefix autocomplete, in the order it walks candidates.
+            models.Index(
+                'user',
+                Collate(Upper('name'), 'C'),
+                name='core_ingred_name_prefix_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeTag(models.Model):
+    """ Link between a recipe and a tag """
+    # Single column indexes are covered by the composite ones below.
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = 'core_recipe_tags'
+        unique_together = [['recipe', 'tag']]
+        indexes = [
+            # Reverse lookup for tag filters, unique_together already
+            # covers (recipe, tag).
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='core_recipetag_tag_recipe_idx',
+            ),
+        ]
+
+
+class RecipeIngredient(models.Model):
+    """ Link between a recipe and an ingredient """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+
+    class Meta:
+        db_table = 'core_recipe_ingredients'
+        unique_together = [['recipe', 'ingredient']]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='core_recipeing_ing_recipe_idx',
+            ),
+        ]
+
+
+# Upper bounds of the recipe price histogram, the last bucket is open.
+PRICE_BUCKETS = (5, 10, 20, 50)
+
+
+def empty_price_buckets():
+    """ Return an all zero recipe price histogram """
+    return [0] * (len(PRICE_BUCKETS) + 1)
+
+
+def price_bucket(price):
+    """ Return the histogram bucket of a recipe price """
+    return bisect_right(PRICE_BUCKETS, price)
+
+
+# Adds the counts of two {id: count} objects, dropping ids counted zero.
+MERGE_COUNTS = '''(
+    SELECT COALESCE(jsonb_object_agg(key, total), '{{}}')
+    FROM (
+        SELECT key, sum(value::bigint) AS total
+        FROM (
+            SELECT * FROM jsonb_each_text(s.{field})
+            UNION ALL SELECT * FROM jsonb_each_text(EXCLUDED.{field})
+        ) counts
+        GROUP BY key
+    ) totals
+    WHERE total > 0
+)'''
+
+# Recomputes the rows of the given users from scratch, the link counts
+# come from the id arrays so the recipes are only scanned.
+REBUILD_STATS = '''
+    WITH recipes AS (
+        SELECT
+            user_id,
+            count(*) AS recipe_count,
+            sum(time_minutes) AS total_time_minutes,
+            sum(price) AS total_price,
+            ARRAY[{buckets}] AS price_buckets
+        FROM core_recipe
+        WHERE user_id = ANY(%(user_ids)s::bigint[])
+        GROUP BY user_id
+    ), {link_counts}
+    INSERT INTO {table} AS s (
+        user_id, recipe_count, total_time_minutes, total_price,
+        price_buckets, tag_counts, ingredient_counts, updated_at
+    )
+    SELECT
+        u.user_id,
+        COALESCE(r.recipe_count, 0),
+        COALESCE(r.total_time_minutes, 0),
+        COALESCE(r.total_price, 0),
+        COALESCE(r.price_buckets, %(empty_buckets)s::bigint[]),
+        COALESCE(tags.counts, '{{}}'),
+        COALESCE(ingredients.counts, '{{}}'),
+        now()
+    FROM unnest(%(user_ids)s::bigint[]) AS u(user_id)
+    LEFT JOIN recipes r USING (user_id)
+    LEFT JOIN tags USING (user_id)
+    LEFT JOIN ingredients USING (user_id)
+    ON CONFLICT (user_id) DO UPDATE SET
+        recipe_count = EXCLUDED.recipe_count,
+        total_time_minutes = EXCLUDED.total_time_minutes,
+        total_price = EXCLUDED.total_price,
+        price_buckets = EXCLUDED.price_buckets,
+        tag_counts = EXCLUDED.tag_counts,
+        ingredient_counts = EXCLUDED.ingredient_counts,
+        updated_at = EXCLUDED.updated_at
+'''
+
+LINK_COUNTS = '''
+    {attr}s AS (
+        SELECT user_id, jsonb_object_agg(link_id, n) AS counts
+        FROM (
+            SELECT user_id, link_id, count(*) AS n
+            FROM core_recipe, unnest({attr}_ids) AS link_id
+            WHERE user_id = ANY(%(user_ids)s::bigint[])
+            GROUP BY user_id, link_id
+        ) links
+        GROUP BY user_id
+    )
+'''
+
+
+class UserRecipeStatsManager(models.Manager):
+    """ Manager keeping the per user recipe statistics up to date """
+
+    def record(self, user_id, recipes=0, time_minutes=0, price=0,
+               price_buckets=None, tags=None, ingredients=None):
+        """
+            Add deltas to the user's statistics in one statement. Bucket
+            deltas map bucket indexes and tag/ ingredient deltas map ids
+            to their change in count.
+        """
+        buckets = empty_price_buckets()
+        for index, delta in (price_buckets or {}).items():
+            buckets[index] += delta
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {self.model._meta.db_table} AS s (
+                    user_id, recipe_count, total_time_minutes, total_price,
+                    price_buckets, tag_counts, ingredient_counts, updated_at
+                )
+                VALUES (
+                    %(user_id)s, %(recipes)s, %(time_minutes)s, %(price)s,
+                    %(buckets)s, %(tags)s, %(ingredients)s, now()
+                )
+                ON CONFLICT (user_id) DO UPDATE SET
+                    recipe_count = s.recipe_count + EXCLUDED.recipe_count,
+                    total_time_minutes =
+                        s.total_time_minutes + EXCLUDED.total_time_minutes,
+                    total_price = s.total_price + EXCLUDED.total_price,
+                    price_buckets = ARRAY(
+                        SELECT a + b
+                        FROM unnest(s.price_buckets, EXCLUDED.price_buckets)
+                            WITH ORDINALITY AS u(a, b, i)
+                        ORDER BY i
+                    ),
+                    tag_counts = {MERGE_COUNTS.format(field='tag_counts')},
+                    ingredient_counts =
+                        {MERGE_COUNTS.format(field='ingredient_counts')},
+                    updated_at = EXCLUDED.updated_at
+                ''',
+                {
+                    'user_id': user_id,
+                    'recipes': recipes,
+                    'time_minutes': time_minutes,
+                    'price': price,
+                    'buckets': buckets,
+                    'tags': self._counts(tags),
+                    'ingredients': self._counts(ingredients),
+                }
+            )
+
+    def summarize(self, recipe_ids):
+        """
+            Return {user_id: totals} of the recipes as stored, totals are
+            record() keyword arguments over just these recipes
+        """
+        summary = {}
+        for user_id, time_minutes, price, tag_ids, ingredient_ids in (
+            Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                'user_id',
+                'time_minutes',
+                'price',
+                'tag_ids',
+                'ingredient_ids',
+            )
+        ):
+            totals = summary.setdefault(user_id, self._empty_totals())
+            totals['recipes'] += 1
+            totals['time_minutes'] += time_minutes
+            totals['price'] += price
+            totals['price_buckets'][price_bucket(price)] += 1
+            totals['tags'].update(tag_ids)
+            totals['ingredients'].update(ingredient_ids)
+
+        return summary
+
+    def _empty_totals(self):
+        """ Return the summarize() totals of no recipes """
+        return {
+            'recipes': 0,
+            'time_minutes': 0,
+            'price': Decimal(0),
+            'price_buckets': Counter(),
+            'tags': Counter(),
+            'ingredients': Counter(),
+        }
+
+    def record_change(self, before, after):
+        """ Record the difference between two summarize() results """
+        for user_id in before.keys() | after.keys():
+            old = before.get(user_id) or self._empty_totals()
+            deltas = {
+                key: value.copy() if isinstance(value, Counter) else value
+                for key, value in (
+                    after.get(user_id) or self._empty_totals()
+                ).items()
+            }
+            for key, value in old.items():
+                if isinstance(value, Counter):
+                    deltas[key].subtract(value)
+                else:
+                    deltas[key] -= value
+
+            if any(
+                any(delta.values()) if isinstance(delta, Counter) else delta
+                for delta in deltas.values()
+            ):
+                self.record(user_id, **deltas)
+
+    def _counts(self, deltas):
+        """ Return JSON for the non zero deltas of an {id: delta} map """
+        return json.dumps({
+            str(pk): delta for pk, delta in (deltas or {}).items() if delta
+        })
+
+    def forget(self, user_id, field, pk):
+        """ Drop a deleted tag/ ingredient from the user's counts """
+        self.filter(user_id=user_id).update(**{
+            field: RawSQL(
+                f'{field} - %s',
+                [str(pk)],
+                output_field=models.JSONField(),
+            ),
+        })
+
+    def rebuild(self, user_ids):
+        """ Recompute the statistics of users from their recipes """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        sql = REBUILD_STATS.format(
+            table=self.model._meta.db_table,
+            buckets=', '.join(
+                f'count(*) FILTER (WHERE {condition})'
+                for condition in self._bucket_conditions()
+            ),
+            link_counts=', '.join(
+                LINK_COUNTS.format(attr=attr)
+                for attr in ('tag', 'ingredient')
+            ),
+        )
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            # Wait for running increments, the counts below then see them.
+            list(self.select_for_update().filter(
+                user_id__in=user_ids
+            ).values_list('pk'))
+            cursor.execute(sql, {
+                'user_ids': user_ids,
+                'empty_buckets': empty_price_buckets(),
+            })
+
+    def _bucket_conditions(self):
+        """ Yield the SQL condition of each price bucket """
+        lower = None
+        for upper in PRICE_BUCKETS + (None,):
+            yield ' AND '.join(filter(None, [
+                lower is not None and f'price >= {lower}',
+                upper is not None and f'price < {upper}',
+            ]))
+            lower = upper
+
+
+class UserRecipeStats(models.Model):
+    """
+        Recipe statistics of a user, updated as recipes change so reading
+        them does not aggregate over the recipes
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.BigIntegerField(default=0)
+    total_time_minutes = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+    )
+    # Recipes per price bucket, see PRICE_BUCKETS.
+    price_buckets = ArrayField(
+        models.BigIntegerField(),
+        default=empty_price_buckets,
+    )
+    # Recipes per tag/ ingredient id, ids without recipes are left out.
+    tag_counts = models.JSONField(default=dict)
+    ingredient_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserRecipeStatsManager()
+
+    def __str__(self):
+        return f'Recipe stats of user {self.user_id}'
+
+    @property
+    def average_time_minutes(self):
+        """ Return the mean cooking time, None without recipes """
+        if not self.recipe_count:
+            return None
+        return round(self.total_time_minutes / self.recipe_count, 2)
+
+    @property
+    def average_price(self):
+        """ Return the mean price, None without recipes """
+        if not self.recipe_count:
+            return None
+        return Decimal(self.total_price) / self.recipe_count
+
+    @property
+    def price_distribution(self):
+        """ Return the price histogram as min/ max/ count dicts """
+        bounds = (None,) + PRICE_BUCKETS + (None,)
+        return [
+            {'min': low, 'max': high, 'count': count}
+            for low, high, count in zip(bounds, bounds[1:], self.price_buckets)
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+        Input rows done by a resumable import_recipes run, written in the
+        transaction of each batch
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    path = models.TextField()
+    rows = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.name}: {self.rows} rows of {self.path}'
@@ -0,0 +1,224 @@
+"""
+    Signal handlers for core models
+"""
+from django.db.models import DEFERRED
+from django.db.models.signals import (
+    post_init,
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import images
+from core.authentication import CachedTokenAuthentication
+from core.models import (
+    User,
+    Recipe,
+    StoredFile,
+    Tag,
+    Ingredient,
+    RecipeTag,
+    RecipeIngredient,
+    UserRecipeStats,
+)
+
+# Recipe fields summarized in UserRecipeStats.
+STATS_FIELDS = ('time_minutes', 'price')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_data_version(sender, instance, **kwargs):
+    """ Invalidate cached data when a user's recipe data changes """
+    User.objects.bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeIngredient)
+def bump_data_version_on_m2m(sender, instance, action, **kwargs):
+    """ Invalidate cached data when recipe links change """
+    if action.startswith('post_'):
+        User.objects.bump_data_version(instance.user_id)
+
+
+def touch_recipes(recipes):
+    """ Move updated_at forward on the given recipe queryset """
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeIngredient)
+def touch_recipes_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """ A recipe's representation changes with its links """
+    if not reverse:
+        if action.startswith('post_'):
+            touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch_recipes(instance.recipe_set.all())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_attr_change(sender, instance, created=False, **kwargs):
+    """ Renaming or deleting a tag/ ingredient changes its recipes """
+    if not created:
+        touch_recipes(instance.recipe_set.all())
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    """ Keep the loaded image name to spot a replaced image on save """
+    image = instance.__dict__.get('image', DEFERRED)
+    instance._image_name = getattr(image, 'name', image)
+
+
+@receiver(pre_save, sender=Recipe)
+def load_deferred_image(sender, instance, update_fields, **kwargs):
+    """ Look up the stored image name when it was not loaded """
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance._image_name is DEFERRED and instance.pk:
+        instance._image_name = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, update_fields, **kwargs):
+    """ Keep stored image reference counts in step with recipes """
+    if update_fields is not None and 'image' not in update_fields:
+        return
+
+    old, new = instance._image_name, instance.image.name
+    if old != new:
+        if new:
+            StoredFile.objects.incref(new)
+        images.release(old)
+        instance._image_name = new
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image(sender, instance, **kwargs):
+    """ Drop the deleted recipe's image reference """
+    images.release(instance._image_name)
+
+
+def stats_values(recipe):
+    """ Return the loaded values of the recipe fields kept in the stats """
+    return tuple(recipe.__dict__.get(name, DEFERRED) for name in STATS_FIELDS)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_stats_values(sender, instance, **kwargs):
+    """ Keep the loaded time and price to spot changes on save """
+    instance._stats_values = stats_values(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def summarize_saved_recipe(sender, instance, update_fields, **kwargs):
+    """ Summarize the stored recipe a save is about to change """
+    instance._stats_before = None
+    if instance._state.adding:
+        instance._stats_before = {}
+    elif (
+        update_fields is None
+        or set(STATS_FIELDS).intersection(update_fields)
+    ) and (
+        DEFERRED in instance._stats_values
+        or stats_values(instance) != instance._stats_values
+    ):
+        instance._stats_before = UserRecipeStats.objects.summarize(
+            [instance.pk]
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def record_recipe_stats(sender, instance, **kwargs):
+    """ Add a new recipe, or the change of a saved one, to the stats """
+    before = instance.__dict__.pop('_stats_before', None)
+    if before is not None:
+        UserRecipeStats.objects.record_change(
+            before,
+            UserRecipeStats.objects.summarize([instance.pk]),
+        )
+        instance._stats_values = stats_values(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_stats(sender, instance, **kwargs):
+    """ Take a recipe and its links out of the stats """
+    UserRecipeStats.objects.record_change(
+        UserRecipeStats.objects.summarize([instance.pk]),
+        {},
+    )
+
+
+@receiver(m2m_changed, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeIngredient)
+def record_link_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+        Count changed links from the trigger maintained id arrays before
+        and after the change, which only differ by links really changed
+    """
+    if action.startswith('pre_'):
+        if not reverse:
+            recipe_ids = [instance.pk]
+        elif action == 'pre_clear':
+            recipe_ids = list(
+                instance.recipe_set.values_list('pk', flat=True)
+            )
+        else:
+            recipe_ids = list(pk_set)
+        instance._stats_links = (
+            recipe_ids,
+            UserRecipeStats.objects.summarize(recipe_ids),
+        )
+        return
+
+    recipe_ids, before = instance.__dict__.pop('_stats_links', (None, None))
+    if recipe_ids:
+        UserRecipeStats.objects.record_change(
+            before,
+            UserRecipeStats.objects.summarize(recipe_ids),
+        )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def forget_attr_stats(sender, instance, **kwargs):
+    """ Drop a deleted tag/ ingredient from its owner's stats """
+    UserRecipeStats.objects.forget(
+        instance.user_id,
+        'tag_counts' if sender is Tag else 'ingredient_counts',
+        instance.pk,
+    )
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """ Stop authenticating with a deleted token """
+    CachedTokenAuthentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, created, **kwargs):
+    """ Reload users on their next request after any change """
+    if not created:
+        for key in Token.objects.filter(user=instance).values_list(
+            'key',
+            flat=True
+        ):
+            CachedTokenAuthentication.invalidate(key)
@@ -0,0 +1,102 @@
+"""
+    Content addressed media storage
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+        File system storage naming files by the SHA-256 of their content.
+        Files are sharded into nested prefix directories, e.g.
+        uploads/recipe/ab/cd/abcd...ef.jpg, and identical uploads share
+        one file.
+    """
+    shard_depth = 2
+    shard_width = 2
+    max_ext_length = 10
+
+    def hashed_name(self, name, content):
+        """ Return the content addressed name for saving `content` """
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        hexdigest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()[:self.max_ext_length]
+        shards = [
+            hexdigest[i * self.shard_width:(i + 1) * self.shard_width]
+            for i in range(self.shard_depth)
+        ]
+
+        return os.path.join(
+            os.path.dirname(name),
+            *shards,
+            f'{hexdigest}{ext}'
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        """ Save `content` unless a file with the same content exists """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.hashed_name(name, content)
+        try:
+            # A reused file counts as new to gc_media --min-age, which
+            # would otherwise sweep it before the reference is committed.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return self._save(name, content)
+
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        """ Names are derived from content so an existing name is reused """
+        return name
+
+    def _save(self, name, content):
+        """
+            Write through a temporary file and rename it into place, so
+            readers never see a partial file and concurrent writers of the
+            same content are harmless.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(
+                    directory,
+                    self.directory_permissions_mode,
+                    exist_ok=True
+                )
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return name
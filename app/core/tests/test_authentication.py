@@ -0,0 +1,76 @@
+"""
+    Test cached token authentication
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import CachedTokenAuthentication
+from core.cache import get_cache
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test token lookups are cached and invalidated """
+
+    def setUp(self):
+        get_cache('TOKEN_AUTH_CACHE').clear()
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """ Test the second request authenticates without a query """
+        self.client.get(ME_URL)
+        hits = CachedTokenAuthentication.stats()[0]['hits']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertEqual(
+            CachedTokenAuthentication.stats()[0]['hits'],
+            hits + 1
+        )
+
+    def test_deleted_token_rejected(self):
+        """ Test a deleted token stops authenticating """
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """ Test a deactivated user stops authenticating """
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_reloaded_after_update(self):
+        """ Test changes through the me endpoint are seen next request """
+        self.client.get(ME_URL)
+        payload = {'name': 'Updated Name', 'password': 'newpassword123'}
+        self.client.patch(ME_URL, payload)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], payload['name'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(payload['password']))
@@ -0,0 +1,74 @@
+"""
+    Test cache backends
+"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from core import cache
+
+
+class LRUCacheTests(SimpleTestCase):
+    """ Test the in-process LRU cache """
+
+    def test_get_set(self):
+        """ Test values are stored and hits/misses counted """
+        lru = cache.LRUCache()
+
+        self.assertIsNone(lru.get('key'))
+        lru.set('key', 'value')
+
+        self.assertEqual(lru.get('key'), 'value')
+        self.assertEqual(
+            lru.stats(),
+            {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+        )
+
+    def test_least_recently_used_evicted(self):
+        """ Test the oldest unused entry is evicted past max_entries """
+        lru = cache.LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(len(lru), 2)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+
+    @patch('core.cache.time.monotonic')
+    def test_entries_expire(self, patched_monotonic):
+        """ Test entries are dropped after their timeout """
+        patched_monotonic.return_value = 100
+        lru = cache.LRUCache(timeout=10)
+        lru.set('key', 'value')
+
+        patched_monotonic.return_value = 111
+
+        self.assertIsNone(lru.get('key'))
+        self.assertEqual(len(lru), 0)
+
+
+class DjangoCacheTests(SimpleTestCase):
+    """ Test the Django cache framework adapter """
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        },
+        TEST_CACHE={
+            'BACKEND': 'core.cache.DjangoCache',
+            'OPTIONS': {'alias': 'default'},
+        },
+    )
+    def test_configured_from_settings(self):
+        """ Test the backend is built from a setting """
+        backend = cache.get_cache('TEST_CACHE')
+        self.addCleanup(cache.get_cache.cache_clear)
+        backend.set('key', 'value')
+
+        self.assertIsInstance(backend, cache.DjangoCache)
+        self.assertEqual(backend.get('key'), 'value')
+        self.assertEqual(backend.stats()['hits'], 1)
@@ -2,13 +2,35 @@
 Test custom Django database commands
 
 """
+from datetime import timedelta
+from io import BytesIO, StringIO
 from unittest.mock import patch
+import json
+import os
+import tempfile
+import time
 
+from PIL import Image
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core import images
+from core.management.commands import gc_media
+from core.models import (
+    ImportCheckpoint,
+    Recipe,
+    StoredFile,
+    Tag,
+    UserRecipeStats,
+)
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -33,3 +55,540 @@ class CommandTests(SimpleTestCase):
         self.assertEqual(patched_check.call_count, 6)
 
         patched_check.assert_called_with(databases=['default'])
+
+
+class ImportRecipesCommandTests(TestCase):
+    """ Test the bulk recipe import command """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+
+        return path
+
+    def test_import_csv(self):
+        """ Test importing recipes with tags and ingredients from CSV """
+        path = self._write('recipes.csv', (
+            'title,description,time_minutes,price,link,tags,ingredients\n'
+            'Soup,Hot,10,5.50,,Vegan|Dinner,Salt|Water\n'
+            'Salad,,5,3.2,http://example.com,Vegan,\n'
+            'Broken,,soon,1,,,\n'
+        ))
+        out = StringIO()
+
+        call_command('import_recipes', path, user=self.user.email,
+                     stdout=out, stderr=StringIO())
+
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 2)
+        soup = recipes.get(title='Soup')
+        self.assertEqual(str(soup.price), '5.50')
+        self.assertEqual(
+            sorted(soup.tags.values_list('name', flat=True)),
+            ['Dinner', 'Vegan']
+        )
+        self.assertEqual(soup.ingredients.count(), 2)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertIn('rows/sec', out.getvalue())
+        self.assertIn('skipped 1 rows', out.getvalue())
+
+    def test_import_updates_stats(self):
+        """ Test imported recipes are added to the user's stats """
+        path = self._write('recipes.csv', (
+            'title,description,time_minutes,price,link,tags,ingredients\n'
+            'Soup,Hot,10,5.50,,Vegan,Salt\n'
+            'Salad,,5,3.20,,Vegan,\n'
+        ))
+
+        call_command('import_recipes', path, user=self.user.email,
+                     batch_size=1, stdout=StringIO())
+
+        stats = UserRecipeStats.objects.get(user=self.user)
+        vegan = Tag.objects.get(user=self.user, name='Vegan')
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(str(stats.total_price), '8.70')
+        self.assertEqual(stats.tag_counts, {str(vegan.pk): 2})
+
+    def test_import_skips_malformed_json_lines(self):
+        """ Test unparsable and non-object JSONL lines are skipped """
+        path = self._write('recipes.jsonl', '\n'.join([
+            '{"title": "Soup", "time_minutes": 10, "price": "5.50"}',
+            '{"title": "Broken",',
+            '["Salad", 5, "3.20"]',
+            '{"title": "Salad", "time_minutes": 5, "price": "3.20"}',
+        ]))
+        out = StringIO()
+        err = StringIO()
+        version = get_user_model().objects.get_data_version(self.user.pk)
+
+        call_command('import_recipes', path, user=self.user.email,
+                     batch_size=2, stdout=out, stderr=err)
+
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Salad', 'Soup']
+        )
+        self.assertIn('skipped 2 rows', out.getvalue())
+        self.assertIn('Skipping invalid row 2', err.getvalue())
+        self.assertIn('Skipping invalid row 3', err.getvalue())
+        # Bumped with each committed batch.
+        self.assertEqual(
+            get_user_model().objects.get_data_version(self.user.pk),
+            version + 2
+        )
+
+    def test_import_skips_rows_with_bad_values(self):
+        """ Test rows with values that do not fit the columns are skipped """
+        rows = [
+            {'title': 'Soup', 'time_minutes': 10, 'price': '5.50'},
+            {'title': 42, 'time_minutes': 5.0, 'price': 2, 'tags': [7]},
+            {'title': 'NaN', 'time_minutes': 1, 'price': 'NaN'},
+            {'title': 'Forever', 'time_minutes': 2 ** 31, 'price': 1},
+            {'title': 'Partial', 'time_minutes': 1.5, 'price': 1},
+            {'title': ['Salad'], 'time_minutes': 1, 'price': 1},
+            {'title': 'Salad', 'time_minutes': 1, 'price': 1, 'tags': 3},
+        ]
+        path = self._write(
+            'recipes.jsonl',
+            '\n'.join(json.dumps(row) for row in rows)
+        )
+        out = StringIO()
+
+        call_command('import_recipes', path, user=self.user.email,
+                     stdout=out, stderr=StringIO())
+
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['42', 'Soup']
+        )
+        recipe = Recipe.objects.get(title='42')
+        self.assertEqual(recipe.time_minutes, 5)
+        self.assertEqual(
+            list(recipe.tags.values_list('name', flat=True)),
+            ['7']
+        )
+        self.assertIn('skipped 5 rows', out.getvalue())
+
+    def test_import_resumes_from_checkpoint(self):
+        """ Test an import resumes after the checkpointed rows """
+        path = self._write('recipes.jsonl', '\n'.join(
+            json.dumps({
+                'title': f'Recipe {i}',
+                'time_minutes': i,
+                'price': '1.00',
+                'tags': ['Vegan'],
+            })
+            for i in range(5)
+        ))
+        ImportCheckpoint.objects.create(name='nightly', path=path, rows=3)
+
+        call_command('import_recipes', path, user=self.user.email,
+                     checkpoint='nightly', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Recipe 3', 'Recipe 4']
+        )
+        self.assertEqual(ImportCheckpoint.objects.get(name='nightly').rows, 5)
+
+    def test_import_checkpoint_commits_with_batch(self):
+        """ Test a batch is rolled back if its checkpoint is not written """
+        path = self._write('recipes.jsonl', json.dumps(
+            {'title': 'Soup', 'time_minutes': 10, 'price': '5.50'}
+        ))
+
+        with patch(
+            'core.management.commands.import_recipes.Command'
+            '._write_checkpoint',
+            side_effect=OperationalError,
+        ):
+            with self.assertRaises(OperationalError):
+                call_command('import_recipes', path, user=self.user.email,
+                             checkpoint='nightly', stdout=StringIO())
+
+        self.assertFalse(Recipe.objects.exists())
+
+
+class ProcessImagesCommandTests(TestCase):
+    """ Test the recipe image worker command """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=self.tmpdir.name,
+            RECIPE_IMAGE_VARIANTS={'thumbnail': (15, 15), 'large': (60, 60)},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=5,
+            price='1.00',
+            image_status=Recipe.IMAGE_PENDING,
+        )
+
+    def _save_image(self, recipe, content=None):
+        if content is None:
+            buf = BytesIO()
+            Image.new('RGB', (120, 80)).save(buf, format='JPEG')
+            content = buf.getvalue()
+        recipe.image.save('photo.jpg', ContentFile(content))
+
+    def test_process_images_creates_variants(self):
+        """ Test queued images are resized into each variant """
+        self._save_image(self.recipe)
+        version = get_user_model().objects.get_data_version(self.user.pk)
+
+        call_command('process_images', once=True, workers=0,
+                     stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        self.assertEqual(
+            sorted(self.recipe.image_variants), ['large', 'thumbnail']
+        )
+        path = os.path.join(
+            self.tmpdir.name, self.recipe.image_variants['large']
+        )
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (60, 40))
+        self.assertGreater(
+            get_user_model().objects.get_data_version(self.user.pk), version
+        )
+
+    def test_process_images_in_pool(self):
+        """ Test images are resized in worker processes """
+        self._save_image(self.recipe)
+
+        call_command('process_images', once=True, workers=1,
+                     stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+
+    def test_process_images_marks_failures(self):
+        """ Test unreadable images are marked as failed """
+        self._save_image(self.recipe, content=b'not an image')
+        err = StringIO()
+
+        call_command('process_images', once=True, workers=0,
+                     stdout=StringIO(), stderr=err)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertIn(str(self.recipe.id), err.getvalue())
+
+    def test_process_images_skips_replaced_image(self):
+        """ Test results for an image replaced mid-job are discarded """
+        self._save_image(self.recipe)
+        job = images.claim_pending(10)[0]
+        self._save_image(self.recipe)
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image_status=Recipe.IMAGE_PENDING,
+        )
+
+        self.assertFalse(images.finish(job, {'large': 'old.jpg'}))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_PENDING)
+
+    def test_claim_marks_recipe_changed(self):
+        """ Test claiming a job changes the recipe and the data version """
+        self._save_image(self.recipe)
+        self.recipe.refresh_from_db()
+        version = get_user_model().objects.get_data_version(self.user.pk)
+
+        images.claim_pending(10)
+
+        claimed = Recipe.objects.get(id=self.recipe.id)
+        self.assertEqual(claimed.image_status, Recipe.IMAGE_PROCESSING)
+        self.assertGreater(claimed.updated_at, self.recipe.updated_at)
+        self.assertGreater(
+            get_user_model().objects.get_data_version(self.user.pk), version
+        )
+
+    def test_process_images_reclaims_expired_jobs(self):
+        """ Test jobs left by a dead worker are handed out again """
+        self._save_image(self.recipe)
+        job = images.claim_pending(10)[0]
+        self.assertEqual(images.claim_pending(10), [])
+
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image_claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        call_command('process_images', once=True, workers=0,
+                     stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        self.assertEqual(self.recipe.image_attempts, 2)
+        self.assertFalse(images.finish(job, {'large': 'old.jpg'}))
+
+    def test_process_images_gives_up_after_max_attempts(self):
+        """ Test a job that keeps getting stuck is marked as failed """
+        self._save_image(self.recipe)
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image_status=Recipe.IMAGE_PROCESSING,
+            image_claimed_at=timezone.now() - timedelta(hours=1),
+            image_attempts=images.MAX_ATTEMPTS,
+        )
+        version = get_user_model().objects.get_data_version(self.user.pk)
+
+        self.assertEqual(images.claim_pending(10), [])
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertGreater(
+            get_user_model().objects.get_data_version(self.user.pk), version
+        )
+
+
+class GcMediaCommandTests(TestCase):
+    """ Test the orphaned media sweeper """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=self.tmpdir.name,
+            RECIPE_IMAGE_VARIANTS={'thumbnail': (15, 15)},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123'
+        )
+        self.recipe = Recipe.objects.create(
+            user=user,
+            title='Soup',
+            time_minutes=5,
+            price='1.00',
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(b'kept'))
+        self.variant = images.variant_name(self.recipe.image.name, 'thumbnail')
+        self.orphans = [
+            self._write('uploads/recipe/aa/bb/aabb.jpg', b'orphan'),
+            self._write(
+                images.variant_name('uploads/recipe/aa/bb/aabb.jpg',
+                                    'thumbnail'),
+                b'variant'
+            ),
+            self._write('uploads/recipe/legacy-uuid.jpg', b'old'),
+        ]
+        self._write(self.variant, b'kept variant')
+        self._age(self.recipe.image.name, self.variant, *self.orphans)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        return name
+
+    def _age(self, *names):
+        old = time.time() - 7200
+        for name in names:
+            os.utime(os.path.join(self.tmpdir.name, name), (old, old))
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self.tmpdir.name, name))
+
+    def test_gc_media_deletes_orphans(self):
+        """ Test unreferenced files are deleted and bytes reported """
+        out = StringIO()
+
+        call_command('gc_media', batch_size=2, stdout=out)
+
+        for name in self.orphans:
+            self.assertFalse(self._exists(name))
+        self.assertTrue(self._exists(self.recipe.image.name))
+        self.assertTrue(self._exists(self.variant))
+        self.assertIn('Deleted 3 orphans, 16 bytes reclaimed', out.getvalue())
+
+    def test_gc_media_keeps_recent_files(self):
+        """ Test files newer than the grace period are kept """
+        recent = self._write('uploads/recipe/cc/dd/ccdd.jpg', b'new')
+
+        call_command('gc_media', stdout=StringIO())
+
+        self.assertTrue(self._exists(recent))
+
+    def test_gc_media_keeps_images_recipes_use(self):
+        """ Test files of recipe images are kept without a stored count """
+        StoredFile.objects.all().delete()
+        stale_variant = self._write(
+            images.variant_name(self.recipe.image.name, 'small'),
+            b'old size'
+        )
+        self._age(stale_variant)
+
+        call_command('gc_media', stdout=StringIO())
+
+        self.assertTrue(self._exists(self.recipe.image.name))
+        self.assertTrue(self._exists(self.variant))
+        self.assertTrue(self._exists(stale_variant))
+
+    def test_gc_media_keeps_files_reused_during_sweep(self):
+        """ Test a file touched after the walk is not deleted """
+        reused = self.orphans[0]
+        referenced = gc_media.Command._referenced
+
+        def reuse(command, names):
+            os.utime(os.path.join(self.tmpdir.name, reused))
+            return referenced(command, names)
+
+        with patch.object(gc_media.Command, '_referenced', reuse):
+            call_command('gc_media', stdout=StringIO())
+
+        self.assertTrue(self._exists(reused))
+        self.assertFalse(self._exists(self.orphans[2]))
+
+    def test_gc_media_dry_run(self):
+        """ Test a dry run only reports orphans """
+        out = StringIO()
+
+        call_command('gc_media', dry_run=True, stdout=out)
+
+        for name in self.orphans:
+            self.assertTrue(self._exists(name))
+        self.assertIn('Would delete 3 orphans', out.getvalue())
+
+
+class LinkArraysCommandTests(TestCase):
+    """ Test checking and rebuilding the recipe id arrays """
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.tag = Tag.objects.create(user=user, name='Vegan')
+        self.recipes = [
+            Recipe.objects.create(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price='5.50',
+            )
+            for i in range(3)
+        ]
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+
+    def _corrupt(self, recipe):
+        """ Clear a recipe's arrays behind the triggers' back """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE core_recipe SET tag_ids = '{}' WHERE id = %s",
+                [recipe.pk],
+            )
+
+    def test_check_link_arrays(self):
+        """ Test consistent arrays pass and stale ones are reported """
+        out = StringIO()
+        call_command('check_link_arrays', stdout=out)
+        self.assertIn('All recipe id arrays match', out.getvalue())
+
+        self._corrupt(self.recipes[1])
+        message = f': {self.recipes[1].pk}.'
+        with self.assertRaisesMessage(CommandError, message):
+            call_command('check_link_arrays')
+
+    def test_backfill_link_arrays(self):
+        """ Test only stale arrays are rewritten, in id batches """
+        for recipe in self.recipes[1:]:
+            self._corrupt(recipe)
+
+        out = StringIO()
+        call_command('backfill_link_arrays', '--batch-size', '1', stdout=out)
+
+        self.assertIn('Updated the id arrays of 2 recipes', out.getvalue())
+        for recipe in self.recipes:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.tag_ids, [self.tag.id])
+        call_command('check_link_arrays', stdout=StringIO())
+
+
+class RebuildRecipeStatsCommandTests(TestCase):
+    """ Test recomputing the recipe stats """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        for price in ('5.50', '7.00'):
+            Recipe.objects.create(
+                user=self.user,
+                title='Recipe',
+                time_minutes=5,
+                price=price,
+            )
+
+    def test_rebuild_recipe_stats(self):
+        """ Test drifted stats are recomputed for every user """
+        UserRecipeStats.objects.filter(user=self.user).update(
+            recipe_count=0,
+            tag_counts={'1': 3},
+        )
+        get_user_model().objects.create_user('other@example.com', None)
+
+        out = StringIO()
+        call_command('rebuild_recipe_stats', '--batch-size', '1', stdout=out)
+
+        stats = UserRecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(str(stats.total_price), '12.50')
+        self.assertEqual(stats.tag_counts, {})
+        self.assertIn('of 2 users', out.getvalue())
+
+    def test_rebuild_unknown_user(self):
+        """ Test rebuilding an unknown user fails """
+        with self.assertRaises(CommandError):
+            call_command('rebuild_recipe_stats', user='nobody@example.com')
+
+
+class BenchmarkListsCommandTests(TestCase):
+    """ Test the list serialization benchmark """
+
+    def test_benchmark_lists(self):
+        """ Test timing both paths on generated recipes, then removing them """
+        out = StringIO()
+        call_command('benchmark_lists', '--sizes', '3,5', '--repeat', '1',
+                     stdout=out)
+
+        rows = out.getvalue().splitlines()[1:]
+        self.assertEqual([row.split()[0] for row in rows], ['3', '5'])
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BenchmarkJsonCommandTests(SimpleTestCase):
+    """ Test the JSON renderer and parser benchmark """
+
+    def test_benchmark_json(self):
+        """ Test timing rendering and parsing per payload size """
+        out = StringIO()
+        call_command('benchmark_json', '--sizes', '2', '--repeat', '1',
+                     stdout=out)
+
+        ops = [row.split()[:2] for row in out.getvalue().splitlines()[1:]]
+        self.assertEqual(ops, [['2', 'render'], ['2', 'parse']])
@@ -1,10 +1,14 @@
 """
     Test Models test cases
 """
-from unittest.mock import patch
 from decimal import Decimal
+import os
+import tempfile
+import threading
 
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from core import models
 
@@ -88,11 +92,246 @@ class ModelTests(TestCase):
             name='Ingredient'
         )
 
-    @patch('core.models.uuid.uuid4')
-    def test_recipe_file_name_uuid(self, mock_uuid):
-        """ Test generating image patch """
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
+    def test_get_or_create_many(self):
+        """ Test bulk get or create reuses existing tags """
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        existing = models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(user=other_user, name='Dessert')
+
+        tags = models.Tag.objects.get_or_create_many(
+            user,
+            ['Dessert', 'Vegan', 'Dessert'],
+        )
+
+        self.assertEqual([tag.name for tag in tags], ['Dessert', 'Vegan'])
+        self.assertEqual(tags[1], existing)
+        self.assertEqual(tags[0].user, user)
+        self.assertEqual(models.Tag.objects.filter(user=user).count(), 2)
+
+    def test_recipe_link_arrays_follow_links(self):
+        """ Test tag_ids/ ingredient_ids track every kind of link change """
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        tags = [
+            models.Tag.objects.create(user=user, name=f'Tag{i}')
+            for i in range(3)
+        ]
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+
+        def arrays():
+            recipe.refresh_from_db()
+            return recipe.tag_ids, recipe.ingredient_ids
+
+        recipe.tags.add(tags[2], tags[0])
+        recipe.ingredients.add(salt)
+        self.assertEqual(arrays(), ([tags[0].id, tags[2].id], [salt.id]))
+
+        recipe.tags.remove(tags[0])
+        models.RecipeTag.objects.bulk_create([
+            models.RecipeTag(recipe=recipe, tag=tags[1]),
+        ])
+        self.assertEqual(arrays(), ([tags[1].id, tags[2].id], [salt.id]))
+
+        tags[2].delete()
+        recipe.ingredients.clear()
+        self.assertEqual(arrays(), ([tags[1].id], []))
+
+    def test_recipe_save_keeps_link_arrays(self):
+        """ Test saving a recipe loaded before a link change keeps it """
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        stale = models.Recipe.objects.get(pk=recipe.pk)
+
+        recipe.tags.add(tag)
+        stale.title = 'Renamed'
+        stale.save()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Renamed')
+        self.assertEqual(recipe.tag_ids, [tag.id])
+
+    def test_recipe_file_name_keeps_extension(self):
+        """ Test the upload path only keeps the file extension """
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
-        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+        self.assertEqual(file_path, 'uploads/recipe/image.jpg')
+
+    def test_recipe_images_share_stored_file(self):
+        """ Test identical images are stored once and reference counted """
+        user = create_user()
+        recipes = [
+            models.Recipe.objects.create(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('5.50'),
+            )
+            for i in range(2)
+        ]
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            for recipe in recipes:
+                recipe.image.save('photo.jpg', ContentFile(b'same bytes'))
+            name = recipes[0].image.name
+
+            self.assertEqual(recipes[1].image.name, name)
+            self.assertEqual(
+                models.StoredFile.objects.get(name=name).refcount, 2
+            )
+
+            with self.captureOnCommitCallbacks(execute=True):
+                recipes[0].delete()
+            self.assertTrue(os.path.exists(recipes[1].image.path))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                recipes[1].image = None
+                recipes[1].save()
+            self.assertFalse(models.StoredFile.objects.exists())
+            # Unlinking is left to gc_media, see images.release().
+            self.assertTrue(os.path.exists(os.path.join(media_root, name)))
+
+
+class RecipeLinkArraysConcurrencyTests(TransactionTestCase):
+    """ Test concurrent link writes all reach the id arrays """
+
+    def test_concurrent_link_inserts(self):
+        """ Test two transactions adding tags to one recipe keep both """
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        tags = [
+            models.Tag.objects.create(user=user, name=f'Tag{i}')
+            for i in range(2)
+        ]
+        inserted = threading.Event()
+
+        def add_second_tag():
+            try:
+                inserted.wait()
+                # Blocks on the recipe row until the first commit.
+                models.RecipeTag.objects.create(recipe=recipe, tag=tags[1])
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=add_second_tag)
+        worker.start()
+        with transaction.atomic():
+            models.RecipeTag.objects.create(recipe=recipe, tag=tags[0])
+            inserted.set()
+            worker.join(0.5)
+        worker.join()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tag_ids, [tags[0].id, tags[1].id])
+
+
+class UserRecipeStatsTests(TestCase):
+    """ Test the incrementally kept recipe statistics """
+
+    def setUp(self):
+        self.user = create_user()
+        self.tags = [
+            models.Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(3)
+        ]
+        self.salt = models.Ingredient.objects.create(
+            user=self.user,
+            name='Salt',
+        )
+
+    def _create(self, price, time_minutes=5):
+        return models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=time_minutes,
+            price=price,
+        )
+
+    def _stats(self):
+        stats = models.UserRecipeStats.objects.get(user=self.user)
+        return (
+            stats.recipe_count,
+            stats.total_time_minutes,
+            stats.total_price,
+            stats.price_buckets,
+            stats.tag_counts,
+            stats.ingredient_counts,
+        )
+
+    def assertStatsRebuildEqual(self):
+        """ Assert the kept stats equal stats computed from scratch """
+        stats = self._stats()
+        models.UserRecipeStats.objects.rebuild([self.user.pk])
+
+        self.assertEqual(stats, self._stats())
+
+    def test_stats_follow_recipe_changes(self):
+        """ Test creating, updating and deleting recipes """
+        cheap = self._create(Decimal('2.50'))
+        dear = self._create(Decimal('75.00'), time_minutes=60)
+
+        self.assertEqual(self._stats(), (
+            2, 65, Decimal('77.50'), [1, 0, 0, 0, 1], {}, {}
+        ))
+
+        cheap.price = '12.00'
+        cheap.save()
+        self.assertEqual(self._stats()[2:4], (
+            Decimal('87.00'), [0, 0, 1, 0, 1]
+        ))
+
+        dear.delete()
+        self.assertEqual(self._stats()[:4], (
+            1, 5, Decimal('12.00'), [0, 0, 1, 0, 0]
+        ))
+        self.assertStatsRebuildEqual()
+
+    def test_stats_follow_link_changes(self):
+        """ Test tag/ ingredient counts through every kind of link change """
+        recipes = [self._create(Decimal('5.00')) for _ in range(3)]
+
+        recipes[0].tags.add(*self.tags[:2])
+        recipes[0].tags.add(self.tags[0])
+        recipes[1].tags.remove(self.tags[0])
+        self.tags[2].recipe_set.add(*recipes)
+        self.salt.recipe_set.add(recipes[0], recipes[1])
+        self.assertEqual(self._stats()[4:], (
+            {
+                str(self.tags[0].pk): 1,
+                str(self.tags[1].pk): 1,
+                str(self.tags[2].pk): 3,
+            },
+            {str(self.salt.pk): 2},
+        ))
+
+        recipes[0].tags.set([self.tags[2]])
+        self.salt.recipe_set.clear()
+        self.tags[2].delete()
+        recipes[2].delete()
+        self.assertEqual(self._stats()[4:], ({}, {}))
+        self.assertStatsRebuildEqual()
+
+    def test_stats_save_without_changes(self):
+        """ Test saves leaving time and price alone skip the stats """
+        recipe = self._create(Decimal('5.00'))
+
+        # The update and the data version bump.
+        with self.assertNumQueries(2):
+            recipe.title = 'Renamed'
+            recipe.save()
@@ -0,0 +1,61 @@
+"""
+    Tests for the content addressed storage
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from core.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    """ Test naming and deduplicating files by content """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.storage = ContentAddressedStorage(location=self.tmpdir.name)
+
+    def test_save_shards_by_content_hash(self):
+        """ Test files are named by hash below prefix directories """
+        digest = hashlib.sha256(b'content').hexdigest()
+
+        name = self.storage.save('uploads/recipe/Photo.JPG',
+                                 ContentFile(b'content'))
+
+        self.assertEqual(
+            name,
+            f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        )
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'content')
+
+    def test_save_deduplicates_identical_content(self):
+        """ Test identical content is stored once """
+        first = self.storage.save('a.jpg', ContentFile(b'content'))
+        second = self.storage.save('b.jpg', ContentFile(b'content'))
+        other = self.storage.save('c.jpg', ContentFile(b'other'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        files = [
+            name
+            for _, _, names in os.walk(self.tmpdir.name)
+            for name in names
+        ]
+        self.assertEqual(len(files), 2)
+
+    def test_save_refreshes_mtime_of_reused_file(self):
+        """ Test saving existing content marks the file as recently used """
+        name = self.storage.save('a.jpg', ContentFile(b'content'))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+
+        self.assertEqual(
+            self.storage.save('b.jpg', ContentFile(b'content')),
+            name
+        )
+        self.assertGreater(os.stat(path).st_mtime, 0)
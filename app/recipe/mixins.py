@@ -0,0 +1,294 @@
+""" Viewset mixins for the Recipe API """
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.http import parse_etags
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from core.cache import get_cache
+
+
+class CachedListMixin:
+    """ Cache list responses per user until their recipe data changes """
+    response_cache = 'RECIPE_RESPONSE_CACHE'
+
+    def get_list_cache_key(self, request):
+        """ Return the cache key for a list request """
+        if getattr(self, '_list_cache_key', None) is None:
+            self._list_cache_key = self._build_list_cache_key(request)
+
+        return self._list_cache_key
+
+    def _build_list_cache_key(self, request):
+        version = get_user_model().objects.get_data_version(request.user.pk)
+        params = sorted(
+            (key, values) for key, values in request.query_params.lists()
+        )
+        digest = hashlib.sha1(
+            repr((request.get_host(), request.path, params)).encode()
+        ).hexdigest()
+
+        return f'{self.basename}:list:{request.user.pk}:{version}:{digest}'
+
+    def get_cached_data(self, request, build):
+        """
+            Return the cached data for the request, calling `build` to
+            make and store it on a miss
+        """
+        cache = get_cache(self.response_cache)
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+
+        if data is None:
+            data = build()
+            cache.set(key, data)
+
+        return data
+
+    def list(self, request, *args, **kwargs):
+        """ Serve the list from cache when the user's data is unchanged """
+        cache = get_cache(self.response_cache)
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data)
+
+        return response
+
+
+class SparseFieldsMixin:
+    """
+        Sparse fieldsets on reads, ?fields= keeps and ?omit= drops
+        serializer fields. Dropped fields stay out of the SQL too, their
+        columns through only() and their relations by not prefetching.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        """ Return the names of the fields to render, None for all """
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        params = self.request.query_params
+        if self.action not in self.sparse_actions or not (
+            'fields' in params or 'omit' in params
+        ):
+            return None
+
+        available = list(self.get_serializer_class().Meta.fields)
+        fields = set(self._split_field_names('fields', available))
+        omit = set(self._split_field_names('omit', available))
+        if 'fields' not in params:
+            fields = set(available)
+
+        return tuple(name for name in available if name in fields - omit)
+
+    def _split_field_names(self, param, available):
+        """ Return the field names of a comma separated query param """
+        names = [
+            name.strip()
+            for name in self.request.query_params.get(param, '').split(',')
+            if name.strip()
+        ]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({param: [
+                f'Unknown field: {", ".join(unknown)}. '
+                f'Expected any of: {", ".join(available)}.'
+            ]})
+
+        return names
+
+    def get_serializer(self, *args, **kwargs):
+        """ Return the serializer without the fields left out """
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in fields:
+                    target.fields.pop(name)
+
+        return serializer
+
+    def get_sparse_columns(self, *required):
+        """
+            Return the model fields read by the rendered serializer fields
+            and `required`, for only(), or None when all are needed.
+            Method fields name their columns in Meta.method_field_sources.
+        """
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return None
+
+        serializer_class = self.get_serializer_class()
+        meta = serializer_class.Meta
+        declared = serializer_class().fields
+        sources = [meta.model._meta.pk.name, *required]
+
+        for name in fields:
+            field = declared[name]
+            if isinstance(field, serializers.ListSerializer):
+                # Relations are prefetched, see get_sparse_prefetches().
+                continue
+            if field.source == '*':
+                method_sources = getattr(meta, 'method_field_sources', {})
+                if name not in method_sources:
+                    return None
+                sources += method_sources[name]
+            elif len(field.source_attrs) > 1:
+                return None
+            else:
+                sources.append(field.source)
+
+        columns = []
+        for source in dict.fromkeys(sources):
+            try:
+                model_field = meta.model._meta.get_field(source)
+            except FieldDoesNotExist:
+                # Annotations are selected regardless of only().
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.append(source)
+
+        return columns
+
+    def get_sparse_prefetches(self, lookups):
+        """ Return the prefetch lookups of relations still rendered """
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return list(lookups)
+
+        declared = self.get_serializer_class()().fields
+        sources = {declared[name].source for name in fields}
+
+        return [
+            lookup for lookup in lookups
+            if (
+                lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+            ).split('__')[0] in sources
+        ]
+
+    def get_etag_variant(self):
+        """ Representations with other fields get other ETags """
+        fields = self.get_sparse_fields()
+        return () if fields is None else (fields,)
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified.'
+    default_code = 'precondition_failed'
+
+
+class ConditionalMixin:
+    """
+        Strong ETags with conditional GET (304) and If-Match on updates.
+        Detail ETags come from the row's updated_at, list ETags from the
+        list cache key so either is known before anything is serialized.
+    """
+
+    def get_etag_variant(self):
+        """ Return what else the representation depends on """
+        return ()
+
+    def _make_etag(self, *parts):
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def _etag_matches(self, header, etag, weak=False):
+        """ Return whether an If-Match/If-None-Match header matches etag """
+        etags = parse_etags(header)
+        if weak:
+            etags = [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+
+        return '*' in etags or etag in etags
+
+    def _not_modified(self, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={
+            'ETag': etag,
+        })
+
+    def get_object_etag(self, pk):
+        """ Return the ETag of the user's object with pk, None if missing """
+        updated_at = self.queryset.filter(
+            user=self.request.user,
+            pk=pk,
+        ).values_list('updated_at', flat=True).first()
+
+        if updated_at is None:
+            return None
+
+        return self._make_etag(
+            self.basename,
+            pk,
+            updated_at.isoformat(),
+            *self.get_etag_variant()
+        )
+
+    def list(self, request, *args, **kwargs):
+        """ List, or 304 when the client has the current version """
+        etag = self._make_etag(self.get_list_cache_key(request))
+        if_none_match = request.headers.get('If-None-Match')
+
+        if if_none_match and self._etag_matches(if_none_match, etag, True):
+            return self._not_modified(etag)
+
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """ Retrieve, or 304 when the client has the current version """
+        etag = self.get_object_etag(kwargs[self.lookup_field])
+        if_none_match = request.headers.get('If-None-Match')
+
+        if etag is None:
+            return super().retrieve(request, *args, **kwargs)
+        if if_none_match and self._etag_matches(if_none_match, etag, True):
+            return self._not_modified(etag)
+
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+
+        return response
+
+    def update(self, request, *args, **kwargs):
+        """ Update, rejecting stale If-Match preconditions """
+        pk = kwargs[self.lookup_field]
+        if_match = request.headers.get('If-Match')
+
+        if if_match is None:
+            response = super().update(request, *args, **kwargs)
+        else:
+            with transaction.atomic():
+                # Lock the row so the check and the write see one version.
+                self.queryset.select_for_update().filter(
+                    user=request.user,
+                    pk=pk,
+                ).exists()
+                etag = self.get_object_etag(pk)
+
+                if etag is not None and not self._etag_matches(if_match, etag):
+                    raise PreconditionFailed()
+
+                response = super().update(request, *args, **kwargs)
+
+        etag = self.get_object_etag(pk)
+        if etag is not None:
+            response['ETag'] = etag
+
+        return response
@@ -0,0 +1,21 @@
+""" Pagination for Recipe API """
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """ Keyset pagination over the newest recipes first """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        """ Use the view's ordering, e.g. by rank for search results """
+        if hasattr(view, 'get_pagination_ordering'):
+            return view.get_pagination_ordering()
+
+        return super().get_ordering(request, queryset, view)
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """ Keyset pagination for tags and ingredients by name """
+    ordering = '-name'
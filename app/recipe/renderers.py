@@ -0,0 +1,90 @@
+""" Renderers for the Recipe API """
+import json
+import re
+
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+) if orjson else 0
+
+# Floats orjson writes differently from json.dumps, 1e16 for 1e+16 and
+# 0.00001 for 1e-05. Both checks lead with a literal to scan quickly,
+# matches inside strings only cost the speedup.
+FLOAT_EXPONENT = re.compile(rb'e(?<=[0-9]e)[-0-9]')
+FLOAT_SMALL = b'0.0000'
+
+default_encoder = encoders.JSONEncoder()
+
+
+def dumps(data, allow_nan=True):
+    """
+        Encode data as compact UTF-8 JSON, byte for byte what json.dumps
+        with DRF's encoder writes. Uses orjson when installed.
+    """
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default_encoder.default, ORJSON_OPTIONS)
+        except TypeError:
+            # Integers beyond 64 bits, or a type DRF's encoder rejects
+            # too, which the json module reports the same way below.
+            pass
+        else:
+            if FLOAT_SMALL not in ret and not FLOAT_EXPONENT.search(ret):
+                return ret
+
+    return json.dumps(
+        data,
+        cls=encoders.JSONEncoder,
+        ensure_ascii=False,
+        allow_nan=allow_nan,
+        separators=(',', ':'),
+    ).encode()
+
+
+def ndjson_line(data):
+    """ Encode data as one line of newline delimited JSON """
+    return dumps(data) + b'\n'
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """ Newline delimited JSON, streamed views yield the lines directly """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return ndjson_line(data)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+        JSONRenderer encoding through orjson when it is installed. Output
+        is identical, except that NaN and infinite floats render as null
+        instead of failing. Indented or non default JSON settings use
+        the json module.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or data is None or indent is not None \
+                or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Keep the output a strict JavaScript subset, as JSONRenderer does.
+        return dumps(data, allow_nan=not self.strict).replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
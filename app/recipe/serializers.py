@@ -1,6 +1,21 @@
 """ Serializer for the Reciper API """
+from collections import Counter
+from operator import itemgetter
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
-from core.models import (Recipe, Tag, Ingredient)
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+    RecipeTag,
+    RecipeIngredient,
+    UserRecipeStats,
+)
 
 class IngredientSerializer(serializers.ModelSerializer):
     """ Serializer for recipe ingredients """
@@ -18,6 +33,20 @@ class TagSerializer(serializers.ModelSerializer):
         fields=['id', 'name']
         read_only_fields=['id']
 
+class IngredientCountSerializer(IngredientSerializer):
+    """ Serializer for ingredients with the number of recipes using them """
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+
+class TagCountSerializer(TagSerializer):
+    """ Serializer for tags with the number of recipes using them """
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
 class RecipeSerializer(serializers.ModelSerializer):
     """ serialializer for Reciper """
     tags = TagSerializer(many=True, required=False)
@@ -26,29 +55,35 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ['id', 'title', 'time_minutes', 'price', 'link', 'tags', 'ingredients']
         read_only_fields = ['id']
+        # Relations the view must prefetch so nested fields do not
+        # issue one query per recipe. Ordered like RecipeListSerializer.
+        prefetch_related = [
+            Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.order_by('pk'),
+            ),
+        ]
 
     def _get_or_create(self, tags, recipe):
         """ Handle getting or creating tags as needed """
         auth_user = self.context['request'].user
+        tag_objs = Tag.objects.get_or_create_many(
+            auth_user,
+            [tag['name'] for tag in tags]
+        )
 
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag
-            )
-            recipe.tags.add(tag_obj)
+        recipe.tags.add(*tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """ Handle getting or creating ingredients as needed """
         auth_user = self.context['request'].user
+        ingredient_objs = Ingredient.objects.get_or_create_many(
+            auth_user,
+            [ingredient['name'] for ingredient in ingredients]
+        )
 
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient
-            )
-
-            recipe.ingredients.add(ingredient_obj)
+        recipe.ingredients.add(*ingredient_objs)
 
     def create(self, validated_data):
         """ Create a Recipe """
@@ -61,37 +96,377 @@ class RecipeSerializer(serializers.ModelSerializer):
         
         return recipe
     
+    def _sync(self, relation, objs):
+        """
+            Link the recipe to exactly objs with at most one delete and
+            one insert, links that stay are left alone
+        """
+        current = set(relation.values_list('pk', flat=True))
+        wanted = [obj.pk for obj in objs]
+        removed = current.difference(wanted)
+        added = [pk for pk in wanted if pk not in current]
+
+        if removed:
+            relation.remove(*removed)
+        if added:
+            relation.add(*added)
+
     def update(self, instance, validated_data):
-        """ Update a recipe """
+        """ Update a recipe, writing only what changed """
+        auth_user = self.context['request'].user
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
 
-        
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create(tags, instance)
-        
+            self._sync(instance.tags, Tag.objects.get_or_create_many(
+                auth_user,
+                [tag['name'] for tag in tags]
+            ))
+
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
-        
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        
-        instance.save()
+            self._sync(
+                instance.ingredients,
+                Ingredient.objects.get_or_create_many(
+                    auth_user,
+                    [ingredient['name'] for ingredient in ingredients]
+                ),
+            )
+
+        changed = [
+            attr for attr, value in validated_data.items()
+            if getattr(instance, attr) != value
+        ]
+        for attr in changed:
+            setattr(instance, attr, validated_data[attr])
+
+        if changed:
+            instance.save(update_fields=[*changed, 'updated_at'])
 
         return instance
 
 class RecipeDetailSerializer(RecipeSerializer):
     """ Serializer for recipe details """
+    image_variants = serializers.SerializerMethodField()
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description',
+            'image',
+            'image_status',
+            'image_variants',
+        ]
+        # Images are only set through upload-image, which queues the
+        # variants, a write here would leave stale ones behind.
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + [
+            'image',
+            'image_status',
+        ]
+        # Columns read by method fields, for sparse fieldsets.
+        method_field_sources = {'image_variants': ['image', 'image_variants']}
+
+    def get_image_variants(self, obj) -> dict:
+        """ Return the URLs of the resized copies of the image """
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in obj.image_variants.items():
+            url = obj.image.storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request else url
+
+        return urls
+
+
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    """ Validate many recipes and write them with set-based queries """
+
+    def validate_items(self):
+        """ Return a (validated_data, errors) pair per payload item """
+        results = []
+        for item in self.initial_data:
+            try:
+                results.append((self.child.run_validation(item), None))
+            except serializers.ValidationError as exc:
+                results.append((None, exc.detail))
+
+        ids = [data['id'] for data, _ in results if data and 'id' in data]
+        self.existing = Recipe.objects.filter(
+            user=self.context['request'].user,
+        ).in_bulk(ids)
+
+        # A recipe given twice has no single outcome, so none of its
+        # items are written.
+        repeated = {pk for pk, count in Counter(ids).items() if count > 1}
+
+        for index, (data, _) in enumerate(results):
+            if data and 'id' in data and data['id'] not in self.existing:
+                results[index] = (None, {'id': ['Recipe not found.']})
+            elif data and data.get('id') in repeated:
+                results[index] = (
+                    None,
+                    {'id': ['Recipe appears more than once in the batch.']},
+                )
+
+        return results
+
+    def _link(self, through, target, recipes, objs, names_per_recipe):
+        """ Replace the links of recipes that were given a list of names """
+        objs_by_name = {obj.name: obj for obj in objs}
+        pairs = [
+            (recipe, names)
+            for recipe, names in zip(recipes, names_per_recipe)
+            if names is not None
+        ]
+
+        replaced = [
+            recipe.id for recipe, _ in pairs if recipe.id in self.existing
+        ]
+        if replaced:
+            through.objects.filter(recipe_id__in=replaced).delete()
+        through.objects.bulk_create([
+            through(recipe_id=recipe.id, **{target: objs_by_name[name].id})
+            for recipe, names in pairs
+            for name in dict.fromkeys(names)
+        ])
+
+    def bulk_save(self, items):
+        """ Create or update validated items, returning their recipes """
+        user = self.context['request'].user
+        now = timezone.now()
+        recipes = []
+        updated_fields = set()
+        tags = []
+        ingredients = []
+
+        for item in items:
+            for names, key in ((tags, 'tags'), (ingredients, 'ingredients')):
+                attrs = item.pop(key, None)
+                names.append(
+                    None if attrs is None else [attr['name'] for attr in attrs]
+                )
+
+            recipe = self.existing.get(item.pop('id', None))
+            if recipe is None:
+                recipe = Recipe(user=user, **item)
+            else:
+                for attr, value in item.items():
+                    setattr(recipe, attr, value)
+                    updated_fields.add(attr)
+                recipe.updated_at = now
+            recipes.append(recipe)
+
+        creates = [recipe for recipe in recipes if recipe.pk is None]
+        updates = [recipe for recipe in recipes if recipe.pk is not None]
+
+        with transaction.atomic():
+            stats_before = UserRecipeStats.objects.summarize(
+                [recipe.pk for recipe in updates]
+            )
+            tag_objs = Tag.objects.get_or_create_many(
+                user,
+                [name for names in tags for name in names or []],
+            )
+            ingredient_objs = Ingredient.objects.get_or_create_many(
+                user,
+                [name for names in ingredients for name in names or []],
+            )
+
+            Recipe.objects.bulk_create(creates)
+            if updates:
+                Recipe.objects.bulk_update(
+                    updates,
+                    [*updated_fields, 'updated_at']
+                )
+
+            self._link(RecipeTag, 'tag_id', recipes, tag_objs, tags)
+            self._link(
+                RecipeIngredient,
+                'ingredient_id',
+                recipes,
+                ingredient_objs,
+                ingredients,
+            )
+            # Bulk writes skip model signals, invalidate caches and
+            # update the stats once.
+            get_user_model().objects.bump_data_version(user.pk)
+            UserRecipeStats.objects.record_change(
+                stats_before,
+                UserRecipeStats.objects.summarize(
+                    [recipe.pk for recipe in recipes]
+                ),
+            )
+
+        return recipes
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """ Serializer for items of a bulk write, items with an id update """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(RecipeSerializer.Meta):
+        read_only_fields = []
+        list_serializer_class = RecipeBulkListSerializer
+
+
+class ValuesListSerializer:
+    """
+        Read only stand-in for `serializer_class(many=True)` over rows of
+        a values() queryset. Accessors are worked out once from the
+        serializer's fields, rows become dicts without a field instance
+        per object and nested lists take one query per relation. Only
+        the names in `fields` are rendered when it is given.
+    """
+    serializer_class = None
+    # to_representation of these returns database values unchanged.
+    passthrough = {
+        serializers.BooleanField.to_representation,
+        serializers.CharField.to_representation,
+        serializers.IntegerField.to_representation,
+    }
+
+    def __init__(self, instance=None, many=True, context=None, fields=None,
+                 **kwargs):
+        self.instance = instance
+        self.context = context or {}
+        serializer = self.serializer_class(context=self.context)
+        self.model = serializer.Meta.model
+        self.pk = self.model._meta.pk.attname
+        self.plan = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                self.plan.append(
+                    (name, field.source, None, self._columns(field.child))
+                )
+            else:
+                source, convert = self._column(field)
+                self.plan.append((name, source, convert, None))
+
+    def _column(self, field):
+        """ Return the values() lookup and converter of a field """
+        if field.source == '*' or not field.source_attrs:
+            raise ImproperlyConfigured(
+                f'{type(self).__name__} cannot read {field.field_name!r}.'
+            )
+
+        convert = field.to_representation
+        if type(field).to_representation in self.passthrough:
+            convert = None
+
+        return '__'.join(field.source_attrs), convert
+
+    def _columns(self, serializer):
+        """ Return (name, lookup, converter) for a nested serializer """
+        return [
+            (name, *self._column(field))
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        ]
+
+    @property
+    def value_fields(self):
+        """ Return the lookups to pass to values() """
+        fields = [
+            source for _, source, _, nested in self.plan if nested is None
+        ]
+        return list(dict.fromkeys([self.pk, *fields]))
+
+    def _related(self, source, columns, pks):
+        """ Return the nested representations per object pk """
+        field = self.model._meta.get_field(source)
+        query_name = field.related_query_name()
+        rows = field.related_model.objects.filter(
+            **{f'{query_name}__in': pks}
+        ).values_list(
+            query_name,
+            'pk',
+            *(lookup for _, lookup, _ in columns)
+        )
+
+        # Sorted here, an ORDER BY would make the planner walk the
+        # related table's primary key instead of probing it.
+        related = {pk: [] for pk in pks}
+        for pk, _, *values in sorted(rows, key=itemgetter(1)):
+            related[pk].append({
+                name: value if convert is None or value is None
+                else convert(value)
+                for (name, _, convert), value in zip(columns, values)
+            })
+
+        return related
+
+    @property
+    def data(self):
+        rows = list(self.instance)
+        pks = [row[self.pk] for row in rows]
+        related = {
+            source: self._related(source, nested, pks)
+            for _, source, _, nested in self.plan
+            if nested is not None
+        }
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert, nested in self.plan:
+                if nested is not None:
+                    item[name] = related[source][row[self.pk]]
+                    continue
+
+                value = row[source]
+                item[name] = value if convert is None or value is None \
+                    else convert(value)
+            data.append(item)
+
+        return data
+
+
+class RecipeListSerializer(ValuesListSerializer):
+    """ Fast read only RecipeSerializer for lists of values() rows """
+    serializer_class = RecipeSerializer
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """ Serialzer for uploading images to recipes """
     class Meta:
         model=Recipe
-        fields=['id', 'image']
-        read_only_fields=['id']
+        fields=['id', 'image', 'image_status']
+        read_only_fields=['id', 'image_status']
         extra_kwargs = {'image': {'required': 'True'}}
+        prefetch_related = []
+
+class FacetSerializer(serializers.Serializer):
+    """ Serializer for the recipe count of one tag or ingredient """
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    count = serializers.IntegerField(read_only=True)
+
+class RecipeFacetsSerializer(serializers.Serializer):
+    """ Serializer for recipe counts per tag and per ingredient """
+    tags = FacetSerializer(many=True, read_only=True)
+    ingredients = FacetSerializer(many=True, read_only=True)
+
+class PriceBucketSerializer(serializers.Serializer):
+    """ Serializer for the recipe count of one price range """
+    min = serializers.DecimalField(
+        max_digits=5, decimal_places=2, read_only=True, allow_null=True
+    )
+    max = serializers.DecimalField(
+        max_digits=5, decimal_places=2, read_only=True, allow_null=True
+    )
+    count = serializers.IntegerField(read_only=True)
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """ Serializer for the recipe statistics of a user """
+    recipe_count = serializers.IntegerField(read_only=True)
+    average_time_minutes = serializers.FloatField(
+        read_only=True, allow_null=True
+    )
+    average_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, read_only=True, allow_null=True
+    )
+    total_price = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    price_distribution = PriceBucketSerializer(many=True, read_only=True)
+    tags = FacetSerializer(many=True, read_only=True)
+    ingredients = FacetSerializer(many=True, read_only=True)
@@ -1,5 +1,6 @@
 """ Tests for Ingredients """
 from decimal import Decimal
+from unittest.mock import patch
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -10,6 +11,7 @@ from rest_framework.test import APIClient
 from core.models import (
     Ingredient,
     Recipe,
+    has_extension,
 )
 from recipe.serializers import IngredientSerializer
 
@@ -54,7 +56,7 @@ class PrivateIngredientApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer= IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """ Test retrieving ingredients created by user themselves """
@@ -65,9 +67,9 @@ class PrivateIngredientApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_update_ingredient(self):
         """ Test upgdating an ingredient """
@@ -82,6 +84,18 @@ class PrivateIngredientApiTests(TestCase):
 
         self.assertEqual(ingredient.name, payload['name'])
     
+    def test_update_ingredient_duplicate_name(self):
+        """ Test renaming onto an existing name is a 400, not a 500 """
+        Ingredient.objects.create(user=self.user, name='salt')
+        ingredient = Ingredient.objects.create(user=self.user, name='pepper')
+
+        res = self.client.patch(detail_url(ingredient.id), {'name': 'salt'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data)
+        ingredient.refresh_from_db()
+        self.assertEqual(ingredient.name, 'pepper')
+
     def test_delete_ingredient(self):
         """ Test deleting an ingredient """
         ingredient = Ingredient.objects.create(user=self.user, name='lettuce')
@@ -112,8 +126,8 @@ class PrivateIngredientApiTests(TestCase):
         s1 = IngredientSerializer(in1)
         s2 = IngredientSerializer(in2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         """ Test filtered ingredeints return the unique list """
@@ -139,5 +153,73 @@ class PrivateIngredientApiTests(TestCase):
 
         res=self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
-    
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_assigned_ingredients_with_counts(self):
+        """ Test counts combine with listing assigned ingredients """
+        ing = Ingredient.objects.create(user=self.user, name='Eggs')
+        Ingredient.objects.create(user=self.user, name='Lentils')
+        self._create_recipe_with(ing)
+        self._create_recipe_with(ing)
+
+        res = self.client.get(
+            INGREDIENTS_URL,
+            {'assigned_only': 1, 'with_counts': 1}
+        )
+
+        self.assertEqual(res.data['results'], [
+            {'id': ing.id, 'name': 'Eggs', 'recipe_count': 2},
+        ])
+
+    def _create_recipe_with(self, *ingredients):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Dish',
+            time_minutes=10,
+            price=Decimal('5.50'),
+        )
+        recipe.ingredients.add(*ingredients)
+
+    def test_autocomplete_ranks_by_usage(self):
+        """ Test autocomplete matches prefixes, most used first """
+        tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+        tomato = Ingredient.objects.create(user=self.user, name='Tomato')
+        Ingredient.objects.create(user=self.user, name='Potato')
+        self._create_recipe_with(tomato)
+        self._create_recipe_with(tomato, tofu)
+        Ingredient.objects.create(
+            user=get_user_model().objects.create_user('other@example.com'),
+            name='Tomatillo',
+        )
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'to'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in res.data][:2],
+            ['Tomato', 'Tofu']
+        )
+        self.assertNotIn('Tomatillo', [i['name'] for i in res.data])
+
+    @patch(
+        'recipe.views.IngredientViewSet.autocomplete_max_results',
+        2
+    )
+    def test_autocomplete_capped(self):
+        """ Test autocomplete returns a bounded, unpaginated list """
+        for i in range(3):
+            Ingredient.objects.create(user=self.user, name=f'Salt {i}')
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'salt'})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_autocomplete_fuzzy(self):
+        """ Test autocomplete tolerates typos with pg_trgm installed """
+        if not has_extension('pg_trgm'):
+            self.skipTest('pg_trgm is not installed')
+        Ingredient.objects.create(user=self.user, name='Cinnamon')
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'cinamon'})
+
+        self.assertEqual([i['name'] for i in res.data], ['Cinnamon'])
@@ -0,0 +1,150 @@
+""" Tests for the values() based recipe list serializer """
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.serializers import (
+    RecipeSerializer,
+    RecipeDetailSerializer,
+    RecipeListSerializer,
+    ValuesListSerializer,
+)
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def render(data):
+    """ Return data as the API would render it """
+    return JSONRenderer().render(data)
+
+
+class RecipeListSerializerTests(TestCase):
+    """ Test the fast list path matches RecipeSerializer exactly """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Dinner', 'Crème brûlée')
+        ]
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        for price, link, recipe_tags in (
+            (Decimal('5.00'), 'https://example.com/a', tags),
+            (Decimal('0.5'), '', tags[::-1]),
+            (Decimal('999.99'), 'x' * 255, []),
+        ):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {price}',
+                time_minutes=0,
+                price=price,
+                link=link,
+            )
+            recipe.tags.add(*recipe_tags)
+            recipe.ingredients.add(salt)
+
+    def _both(self):
+        queryset = Recipe.objects.filter(user=self.user).order_by('-id')
+        expected = RecipeSerializer(
+            queryset.prefetch_related(*RecipeSerializer.Meta.prefetch_related),
+            many=True,
+        ).data
+        data = RecipeListSerializer(
+            queryset.values(*RecipeListSerializer().value_fields)
+        ).data
+
+        return data, expected
+
+    def test_rendered_output_identical(self):
+        """ Test both paths render to the same bytes """
+        data, expected = self._both()
+
+        self.assertEqual(render(data), render(expected))
+
+    def test_nested_lists_ordered_by_id(self):
+        """ Test nested objects are ordered by id whatever the link order """
+        data, _ = self._both()
+
+        for recipe in data:
+            ids = [tag['id'] for tag in recipe['tags']]
+            self.assertEqual(ids, sorted(ids))
+
+    def test_empty_rows(self):
+        """ Test an empty page serializes without queries """
+        with self.assertNumQueries(0):
+            data = RecipeListSerializer(Recipe.objects.none().values()).data
+
+        self.assertEqual(data, [])
+
+    def test_unreadable_field_rejected(self):
+        """ Test fields without a model source are refused """
+        class DetailListSerializer(ValuesListSerializer):
+            serializer_class = RecipeDetailSerializer
+
+        with self.assertRaises(ImproperlyConfigured):
+            DetailListSerializer()
+
+
+class RecipeListAPIParityTests(TestCase):
+    """ Test the list API renders the same with either serializer """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+        self.tag = Tag.objects.create(user=self.user, name='Soup')
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Tomato soup {"tomato " * i}',
+                time_minutes=i,
+                price=Decimal('1.25') * i,
+            )
+            if i % 2:
+                recipe.tags.add(self.tag)
+
+    def _get_pages(self, params):
+        """ Return the rendered pages of a paged list """
+        pages = []
+        res = self.client.get(RECIPE_URL, {'page_size': 2, **params})
+        pages.append(render(res.data))
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            pages.append(render(res.data))
+
+        return pages
+
+    def test_list_parity(self):
+        """ Test plain, filtered and searched pages are identical """
+        for params in ({}, {'tags': self.tag.id}, {'search': 'tomato'}):
+            fast = self._get_pages(params)
+            # Bypass the response cache so both paths really run.
+            get_user_model().objects.bump_data_version(self.user.pk)
+
+            with patch(
+                'recipe.views.RecipeViewSet.list_serializer_class',
+                None
+            ):
+                slow = self._get_pages(params)
+
+            self.assertEqual(fast, slow, params)
@@ -0,0 +1,109 @@
+""" Test recipe media APIs """
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import images
+from core.models import Recipe
+
+
+def media_url(name):
+    """ Return the media URL of a stored file """
+    return reverse('recipe:media', args=[name])
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """ Create and return a user """
+    return get_user_model().objects.create_user(email, password)
+
+
+class PublicMediaAPITests(TestCase):
+    """ Tests for unauthenticated media requests """
+
+    def test_auth_required(self):
+        """ Test auth is required to fetch media """
+        res = APIClient().get(media_url('uploads/recipe/a.jpg'))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateMediaAPITests(TestCase):
+    """ Tests for authenticated media requests """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = override_settings(MEDIA_ROOT=self.tmpdir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(b'image bytes'))
+        self.name = self.recipe.image.name
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_media_redirects_to_nginx(self):
+        """ Test owners get an X-Accel-Redirect with immutable caching """
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected-media/{self.name}'
+        )
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=None)
+    def test_media_served_without_nginx(self):
+        """ Test the file is streamed by Django when no proxy is set """
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'image bytes')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_media_variant(self):
+        """ Test variants are served to the owner of the image """
+        variant = images.variant_name(self.name, 'thumbnail')
+
+        res = self.client.get(media_url(variant))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected-media/{variant}'
+        )
+
+    def test_media_of_other_user(self):
+        """ Test images of other users are not served """
+        self.client.force_authenticate(create_user('other@example.com'))
+
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_media_path_traversal(self):
+        """ Test paths escaping the upload directory are rejected """
+        name = self.name.replace('recipe/', 'recipe/../recipe/')
+
+        res = self.client.get(media_url(name))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
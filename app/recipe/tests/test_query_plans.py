@@ -0,0 +1,176 @@
+""" Tests for the query plans behind the Recipe API """
+from decimal import Decimal
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def seed_user(email, recipes=60, attrs=20):
+    """ Create and return a user with a library of linked recipes """
+    user = get_user_model().objects.create_user(email, 'testpass123')
+    tags = Tag.objects.get_or_create_many(
+        user,
+        [f'tag{i}' for i in range(attrs)]
+    )
+    ingredients = Ingredient.objects.get_or_create_many(
+        user,
+        [f'ingredient{i}' for i in range(attrs)]
+    )
+    Recipe.objects.bulk_create([
+        Recipe(
+            user=user,
+            title=f'Recipe {i}',
+            time_minutes=i,
+            price=Decimal('5.00'),
+        )
+        for i in range(recipes)
+    ])
+
+    for i, recipe in enumerate(Recipe.objects.filter(user=user)):
+        recipe.tags.add(tags[i % attrs], tags[(i + 1) % attrs])
+        recipe.ingredients.add(ingredients[i % attrs])
+
+    return user
+
+
+class QueryPlanTests(TestCase):
+    """ Test listed endpoints are served from indexes """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Rows rolled back by earlier tests leave the tables padded with
+        # dead tuples, which sways plans this small. Start from fresh
+        # files, the truncation is rolled back with the class.
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE core_user CASCADE')
+
+        cls.user = seed_user('user@example.com')
+        for i in range(3):
+            seed_user(f'other{i}@example.com')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        # Sequential scans are only chosen now when no index applies.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def _plan_nodes(self, plan):
+        """ Yield every node of a JSON query plan """
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from self._plan_nodes(child)
+
+    def _leading_column(self, cursor, index_name):
+        """ Return the first key column of an index """
+        cursor.execute(
+            '''
+            SELECT a.attname FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_attribute a
+                ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE c.relname = %s
+            ''',
+            [index_name]
+        )
+        return cursor.fetchone()[0]
+
+    def assertNoSeqScan(self, url, params=None):
+        """ Request url and assert none of its queries scan a whole table """
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(ctx.captured_queries)
+
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {query["sql"]}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+
+                for node in self._plan_nodes(plan[0]['Plan']):
+                    self.assertNotEqual(
+                        node['Node Type'], 'Seq Scan', query['sql']
+                    )
+                    if 'Index Name' not in node:
+                        continue
+
+                    # An index walked end to end is a sequential scan too.
+                    column = self._leading_column(cursor, node['Index Name'])
+                    condition = node.get('Index Cond', '')
+                    self.assertRegex(
+                        condition, rf'\b{column}\b', query['sql']
+                    )
+                    self.assertNotIn(
+                        f'{column} IS NOT NULL', condition, query['sql']
+                    )
+
+        return res
+
+    def test_recipe_list(self):
+        """ Test listing and paging recipes uses indexes """
+        res = self.assertNoSeqScan(RECIPE_URL, {'page_size': 10})
+        self.assertNoSeqScan(res.data['next'])
+
+    def test_recipe_detail(self):
+        """ Test recipe detail uses indexes """
+        recipe = Recipe.objects.filter(user=self.user).first()
+
+        self.assertNoSeqScan(reverse('recipe:recipe-detail', args=[recipe.id]))
+
+    def test_recipe_filters(self):
+        """ Test filtering recipes by tags and ingredients uses indexes """
+        tag_ids = Tag.objects.filter(user=self.user).values_list(
+            'id', flat=True
+        )
+        ingredient = Ingredient.objects.filter(user=self.user).first()
+        tags = ','.join(str(tag_id) for tag_id in tag_ids[:2])
+
+        self.assertNoSeqScan(RECIPE_URL, {'tags': tags})
+        self.assertNoSeqScan(RECIPE_URL, {'tags': tags, 'match': 'all'})
+        self.assertNoSeqScan(RECIPE_URL, {'ingredients': ingredient.id})
+
+    def test_recipe_search(self):
+        """ Test searching recipes uses indexes """
+        res = self.assertNoSeqScan(RECIPE_URL, {'search': 'recipe 7'})
+        self.assertTrue(res.data['results'])
+
+        self.assertNoSeqScan(RECIPE_URL, {'search': 'recipe', 'tags': '1'})
+
+    def test_attr_lists(self):
+        """ Test listing tags and ingredients uses indexes """
+        for url in (TAGS_URL, INGREDIENTS_URL):
+            self.assertNoSeqScan(url)
+
+    def test_attr_assigned_with_counts(self):
+        """ Test assigned only and counted attributes use indexes """
+        for url in (TAGS_URL, INGREDIENTS_URL):
+            self.assertNoSeqScan(url, {'assigned_only': 1, 'with_counts': 1})
+
+    def test_attr_autocomplete(self):
+        """ Test autocompleting tags and ingredients uses indexes """
+        self.assertNoSeqScan(TAGS_URL, {'q': 'tag1'})
+        self.assertNoSeqScan(INGREDIENTS_URL, {'q': 'ingredient1'})
@@ -1,17 +1,22 @@
 """ Tests for the Recipe API """
 from decimal import Decimal
+from unittest.mock import patch
+import json
 import tempfile
 import os
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.cache import get_cache
 from core.models import (
     Recipe,
     Tag,
@@ -24,6 +29,10 @@ from recipe.serializers import (
 )
 
 RECIPE_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+EXPORT_URL = reverse('recipe:recipe-export')
+FACETS_URL = reverse('recipe:recipe-facets')
+STATS_URL = reverse('recipe:stats')
 
 def detail_url(recipe_id):
     """ Create and return recipe details URL """
@@ -82,7 +91,7 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """ Test retrieving the recipes list by authenticated user """
@@ -96,7 +105,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data,serializer.data)
+        self.assertEqual(res.data['results'],serializer.data)
 
     def test_get_recipe_detail(self):
         """Test get recipe detail """
@@ -286,6 +295,79 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(tag_lunch, recipe.tags.all())
         self.assertNotIn(tag_breakfast, recipe.tags.all())
 
+    def _patch_sql(self, recipe, payload):
+        """ Patch a recipe and return the SQL of the writes it issued """
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id),
+                payload,
+                format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def test_update_tags_writes_only_difference(self):
+        """ Test replacing one tag keeps the other links untouched """
+        recipe = create_recipe(user=self.user)
+        names = [f'tag{i}' for i in range(5)]
+        recipe.tags.add(*Tag.objects.get_or_create_many(self.user, names))
+        kept = dict(
+            recipe.tags.through.objects.filter(
+                recipe=recipe,
+                tag__name__in=names[1:],
+            ).values_list('tag_id', 'id')
+        )
+
+        writes = self._patch_sql(recipe, {
+            'tags': [{'name': name} for name in names[1:] + ['new']],
+        })
+
+        link_writes = [sql for sql in writes if 'core_recipe_tags' in sql]
+        self.assertEqual(
+            [sql.split()[0] for sql in link_writes],
+            ['DELETE', 'INSERT']
+        )
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            sorted(names[1:] + ['new'])
+        )
+        self.assertEqual(
+            kept,
+            dict(recipe.tags.through.objects.filter(
+                recipe=recipe,
+                tag_id__in=kept,
+            ).values_list('tag_id', 'id'))
+        )
+
+    def test_update_unchanged_recipe_skips_writes(self):
+        """ Test an update repeating the stored data writes nothing """
+        recipe = create_recipe(user=self.user, title='Soup')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        writes = self._patch_sql(recipe, {
+            'title': 'Soup',
+            'price': '5.5',
+            'tags': [{'name': 'Vegan'}],
+        })
+
+        self.assertEqual(writes, [])
+
+    def test_partial_update_writes_changed_columns(self):
+        """ Test only the changed columns are saved """
+        recipe = create_recipe(user=self.user, title='Soup')
+
+        writes = self._patch_sql(recipe, {'title': 'Stew', 'time_minutes': 5})
+
+        update = next(sql for sql in writes if 'UPDATE "core_recipe"' in sql)
+        self.assertIn('"title"', update)
+        self.assertIn('"updated_at"', update)
+        self.assertNotIn('"description"', update)
+        self.assertNotIn('"time_minutes"', update)
+
     def test_clear_recipe_tags(self):
         """ Test clearing a recipe tags """
         tag = Tag.objects.create(user=self.user, name='dessert')
@@ -393,6 +475,49 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.ingredients.count(), 0)
 
+    def test_create_recipe_query_count_independent_of_items(self):
+        """ Test tags and ingredients are created in bulk """
+        Tag.objects.create(user=self.user, name='tag0')
+        Ingredient.objects.create(user=self.user, name='ingredient0')
+        query_counts = []
+
+        for size in (3, 30):
+            payload = {
+                'title': f'Recipe {size}',
+                'time_minutes': 10,
+                'price': Decimal('5.00'),
+                'tags': [{'name': f'tag{i}'} for i in range(size)],
+                'ingredients': [
+                    {'name': f'ingredient{i}'} for i in range(size)
+                ],
+            }
+
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(RECIPE_URL, payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            recipe = Recipe.objects.get(id=res.data['id'])
+            self.assertEqual(recipe.tags.count(), size)
+            self.assertEqual(recipe.ingredients.count(), size)
+            query_counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 30)
+
+    def test_create_recipe_with_duplicate_tags(self):
+        """ Test repeated tag names in a payload are only created once """
+        payload = {
+            'title': 'Pongal',
+            'time_minutes': 60,
+            'price': Decimal('55.6'),
+            'tags': [{'name': 'Indian'}, {'name': 'Indian'}]
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
     def test_filter_by_tags(self):
         """ filtering recipe by tags """
         r1 = create_recipe(user=self.user, title='Thai dish')
@@ -414,9 +539,9 @@ class PrivateRecipeAPITests(TestCase):
         s3 = RecipeSerializer(r3)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
     
     def test_filter_by_ingredients(self):
         """ Filtering recipe by ingredients """
@@ -439,9 +564,829 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.get(RECIPE_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_list_recipes_query_count_constant(self):
+        """ Test listing recipes does not query once per recipe """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+
+        for count in (2, 10):
+            while Recipe.objects.filter(user=self.user).count() < count:
+                recipe = create_recipe(user=self.user)
+                recipe.tags.add(tag)
+                recipe.ingredients.add(ingredient)
+
+            # Data version lookup, recipes and one query per relation.
+            with self.assertNumQueries(4):
+                res = self.client.get(RECIPE_URL)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(res.data['results']), count)
+
+    def test_get_recipe_detail_query_count(self):
+        """ Test recipe detail prefetches tags and ingredients """
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt')
+        )
+
+        # ETag lookup, recipe and one query per relation.
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, RecipeDetailSerializer(recipe).data)
+
+    def test_recipes_paginated_by_cursor(self):
+        """ Test recipes are paginated and stable across writes """
+        r1 = create_recipe(user=self.user, title='First')
+        r2 = create_recipe(user=self.user, title='Second')
+        r3 = create_recipe(user=self.user, title='Third')
+
+        res = self.client.get(RECIPE_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [r3.id, r2.id]
+        )
+        self.assertIsNone(res.data['previous'])
+
+        create_recipe(user=self.user, title='Fourth')
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [r1.id]
+        )
+        self.assertIsNone(res.data['next'])
+
+    @patch('recipe.pagination.RecipeCursorPagination.max_page_size', 2)
+    def test_recipes_page_size_capped(self):
+        """ Test the client page size is capped """
+        for _ in range(3):
+            create_recipe(user=self.user)
+
+        res = self.client.get(RECIPE_URL, {'page_size': 50})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_filter_by_tags_match_all(self):
+        """ Test filtering recipes having all of the given tags """
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dessert')
+        r1 = create_recipe(user=self.user, title='Vegan cake')
+        r1.tags.add(tag1, tag2)
+        r2 = create_recipe(user=self.user, title='Vegan curry')
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPE_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [r1.id]
+        )
+
+    def test_filter_by_tags_without_distinct(self):
+        """ Test filtering by tags returns each recipe once, no DISTINCT """
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dessert')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag1, tag2)
+
+        params = {'tags': f'{tag1.id},{tag2.id}'}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPE_URL, params)
+
+        self.assertEqual(len(res.data['results']), 1)
+        for query in ctx.captured_queries:
+            self.assertNotIn('DISTINCT', query['sql'])
+
+    def test_filter_invalid_match(self):
+        """ Test an unknown match mode is rejected """
+        res = self.client.get(RECIPE_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_arrays_match_link_tables(self):
+        """ Test the id array filters return what the link tables do """
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Dessert', 'Quick')
+        ]
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        for i in range(6):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(*tags[i % 3:i % 3 + 2])
+            if i % 2:
+                recipe.ingredients.add(salt)
+        tag_ids = f'{tags[0].id},{tags[1].id}'
+
+        for params in (
+            {'tags': tag_ids},
+            {'tags': tag_ids, 'match': 'all'},
+            {'tags': tag_ids, 'ingredients': salt.id, 'match': 'all'},
+            {'tags': tags[2].id, 'ingredients': salt.id},
+        ):
+            res = self.client.get(RECIPE_URL, {**params, 'page_size': 10})
+            # Bypass the response cache so both filters really run.
+            get_user_model().objects.bump_data_version(self.user.pk)
+            with patch(
+                'recipe.views.RecipeViewSet.filter_by_arrays',
+                False
+            ):
+                expected = self.client.get(
+                    RECIPE_URL,
+                    {**params, 'page_size': 10}
+                )
+
+            self.assertTrue(expected.data['results'], params)
+            self.assertEqual(res.data, expected.data, params)
+
+    def test_search_ranks_title_matches_first(self):
+        """ Test searching orders title matches above description ones """
+        r1 = create_recipe(user=self.user, title='Tomato soup')
+        r2 = create_recipe(
+            user=self.user,
+            title='Pasta',
+            description='Served with roasted tomatoes',
+        )
+        create_recipe(user=self.user, title='Pancakes')
+        create_recipe(user=create_user(email='other@example.com',
+                                       password='test123'),
+                      title='Tomato salad')
+
+        res = self.client.get(RECIPE_URL, {'search': 'tomato'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [r1.id, r2.id]
+        )
+
+    def test_search_tracks_updates(self):
+        """ Test the search index follows title changes """
+        recipe = create_recipe(user=self.user, title='Tomato soup')
+        recipe.title = 'Onion soup'
+        recipe.save()
+
+        res = self.client.get(RECIPE_URL, {'search': 'tomato'})
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_search_with_filters(self):
+        """ Test search combines with tag filters """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user, title='Tomato soup')
+        r1.tags.add(tag)
+        create_recipe(user=self.user, title='Tomato stew')
+
+        res = self.client.get(RECIPE_URL, {'search': 'tomato', 'tags': tag.id})
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [r1.id]
+        )
+
+    @patch('recipe.views.RecipeViewSet.search_max_matches', 2)
+    def test_search_ranks_newest_matches_only(self):
+        """ Test broad searches only rank a bounded number of matches """
+        create_recipe(user=self.user, title='Tomato tomato tomato')
+        newer = [
+            create_recipe(user=self.user, title='Tomato').id
+            for _ in range(2)
+        ]
+
+        res = self.client.get(RECIPE_URL, {'search': 'tomato'})
+
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in res.data['results']),
+            newer
+        )
+
+    def test_search_paginates_by_rank(self):
+        """ Test search results page through every match once """
+        ids = {
+            create_recipe(user=self.user, title=f'Tomato {"tomato " * i}').id
+            for i in range(5)
+        }
+
+        seen = []
+        res = self.client.get(RECIPE_URL, {'search': 'tomato', 'page_size': 2})
+        seen += [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), ids)
+
+    def test_search_pages_tied_ranks_to_the_end(self):
+        """ Test paging tied and near tied ranks reaches every match """
+        ids = set()
+        for i in range(30):
+            recipe = create_recipe(
+                user=self.user,
+                title='Tomato soup' if i % 2 else f'Tomato {i}',
+                description='tomato ' * (i % 3),
+            )
+            ids.add(recipe.id)
+
+        seen = []
+        res = self.client.get(RECIPE_URL, {'search': 'tomato', 'page_size': 4})
+        seen += [recipe['id'] for recipe in res.data['results']]
+        while res.data['next'] and len(seen) <= len(ids):
+            res = self.client.get(res.data['next'])
+            seen += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertIsNone(res.data['next'])
+        self.assertEqual(len(seen), len(ids))
+        self.assertEqual(set(seen), ids)
+
+    def test_list_served_from_cache(self):
+        """ Test repeated list calls are served from the cache """
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_cache_invalidated_on_write(self):
+        """ Test the cached list changes when the user's data changes """
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Vegan')
+
+        recipe.delete()
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_list_cache_keyed_on_params(self):
+        """ Test differently filtered lists are cached separately """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+        create_recipe(user=self.user)
+        cache = get_cache('RECIPE_RESPONSE_CACHE')
+        misses = cache.misses
+
+        res1 = self.client.get(RECIPE_URL)
+        res2 = self.client.get(RECIPE_URL, {'tags': tag.id})
+
+        self.assertEqual(len(res1.data['results']), 2)
+        self.assertEqual(len(res2.data['results']), 1)
+        self.assertEqual(cache.misses, misses + 2)
+
+    def test_detail_not_modified(self):
+        """ Test a matching If-None-Match returns 304 without a body """
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_detail_etag_changes_with_related_data(self):
+        """ Test the ETag changes when tags are added or renamed """
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag1 = self.client.get(url)['ETag']
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag1)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag2 = res['ETag']
+        self.assertNotEqual(etag1, etag2)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag2)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegetarian')
+
+    def test_list_not_modified(self):
+        """ Test list returns 304 until the user's data changes """
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_update_if_match(self):
+        """ Test updates honour If-Match for optimistic concurrency """
+        recipe = create_recipe(user=self.user, title='Original')
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.patch(url, {'title': 'First'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+        res = self.client.patch(url, {'title': 'Second'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'First')
+
+
+class SparseFieldsRecipeAPITests(TestCase):
+    """ Test the fields/ omit sparse fieldsets of the recipe API """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+        self.recipe = create_recipe(user=self.user, title='Tomato soup')
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+    def _get(self, url, params):
+        """ Return the response and the SQL of its queries """
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params)
+
+        return res, '\n'.join(query['sql'] for query in ctx.captured_queries)
+
+    def test_list_fields(self):
+        """ Test listing only some fields selects only their columns """
+        res, sql = self._get(RECIPE_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['results'],
+            [{'id': self.recipe.id, 'title': 'Tomato soup'}]
+        )
+        self.assertNotIn('"price"', sql)
+        self.assertNotIn('core_tag', sql)
+
+    def test_list_omit(self):
+        """ Test omitted relations are not fetched """
+        res, sql = self._get(RECIPE_URL, {'omit': 'tags,ingredients'})
+
+        self.assertEqual(
+            list(res.data['results'][0]),
+            ['id', 'title', 'time_minutes', 'price', 'link']
+        )
+        self.assertNotIn('core_tag', sql)
+        self.assertNotIn('core_ingredient', sql)
+
+    @patch('recipe.views.RecipeViewSet.list_serializer_class', None)
+    def test_list_fields_with_serializer(self):
+        """ Test the RecipeSerializer list path narrows columns too """
+        res, sql = self._get(RECIPE_URL, {'fields': 'title,tags'})
+
+        self.assertEqual(res.data['results'], [{
+            'title': 'Tomato soup',
+            'tags': [{'id': self.recipe.tags.get().id, 'name': 'Vegan'}],
+        }])
+        self.assertNotIn('"price"', sql)
+        self.assertNotIn('core_ingredient', sql)
+
+    def test_detail_fields(self):
+        """ Test a recipe detail never loads columns it leaves out """
+        res, sql = self._get(detail_url(self.recipe.id), {'fields': 'title'})
+
+        self.assertEqual(res.data, {'title': 'Tomato soup'})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('core_tag', sql)
+
+    def test_detail_method_field(self):
+        """ Test method fields load the columns they read """
+        self.recipe.image_variants = {'thumbnail': 'thumb.jpg'}
+        self.recipe.save()
+
+        res, sql = self._get(
+            detail_url(self.recipe.id),
+            {'fields': 'image_variants'}
+        )
+
+        self.assertEqual(
+            res.data['image_variants']['thumbnail'],
+            'http://testserver/api/recipe/media/thumb.jpg'
+        )
+        self.assertNotIn('"description"', sql)
+
+    def test_unknown_field(self):
+        """ Test asking for a field the serializer lacks is an error """
+        res = self.client.get(RECIPE_URL, {'fields': 'id,description'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+    def test_detail_etag_per_fieldset(self):
+        """ Test a sparse detail does not match the full ETag """
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+
+class BulkRecipeAPITests(TestCase):
+    """ Test the bulk recipe write API """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, count, offset=0):
+        return [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': i,
+                'price': '5.00',
+                'tags': [{'name': 'Bulk'}, {'name': f'tag{i}'}],
+                'ingredients': [{'name': f'ingredient{i}'}],
+            }
+            for i in range(offset, offset + count)
+        ]
+
+    def test_bulk_create(self):
+        """ Test creating many recipes with shared tags """
+        res = self.client.post(BULK_URL, self._payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in res.data['results']],
+            ['created'] * 3
+        )
+        recipe = Recipe.objects.get(id=res.data['results'][2]['id'])
+        self.assertEqual(recipe.title, 'Recipe 2')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Bulk', 'tag2']
+        )
+        self.assertEqual(recipe.ingredients.get().name, 'ingredient2')
+        self.assertEqual(Tag.objects.filter(name='Bulk').count(), 1)
+
+    def test_bulk_query_count_independent_of_size(self):
+        """ Test a batch costs the same number of queries at any size """
+        query_counts = []
+        for offset, count in ((0, 5), (5, 50)):
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(
+                    BULK_URL,
+                    self._payload(count, offset),
+                    format='json'
+                )
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            query_counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 55)
+
+    def test_bulk_update(self):
+        """ Test items with an id update the existing recipe """
+        recipe = create_recipe(user=self.user, title='Old title')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Old'))
+        payload = self._payload(1)
+        payload[0]['id'] = recipe.id
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.data['results'][0]['status'], 'updated')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Recipe 0')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Bulk', 'tag0']
+        )
+
+    def test_bulk_abort_on_error(self):
+        """ Test an invalid item aborts the whole batch by default """
+        other_recipe = create_recipe(
+            user=create_user(email='other@example.com', password='test123')
+        )
+        payload = self._payload(3)
+        del payload[1]['title']
+        payload[2]['id'] = other_recipe.id
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [result['index'] for result in res.data['results']],
+            [1, 2]
+        )
+        self.assertIn('title', res.data['results'][0]['errors'])
+        self.assertIn('id', res.data['results'][1]['errors'])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_skip_invalid(self):
+        """ Test on_error=skip writes the valid items """
+        payload = self._payload(2)
+        payload[0]['price'] = 'free'
+
+        res = self.client.post(
+            f'{BULK_URL}?on_error=skip',
+            payload,
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in res.data['results']],
+            ['error', 'created']
+        )
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_rejects_duplicate_ids(self):
+        """ Test items repeating a recipe id are invalid """
+        recipe = create_recipe(user=self.user, title='Old title')
+        payload = self._payload(3)
+        payload[0]['id'] = recipe.id
+        payload[2]['id'] = recipe.id
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [result['index'] for result in res.data['results']],
+            [0, 2]
+        )
+        self.assertIn('id', res.data['results'][0]['errors'])
+
+        res = self.client.post(
+            f'{BULK_URL}?on_error=skip',
+            payload,
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in res.data['results']],
+            ['error', 'created', 'error']
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Old title')
+
+    def test_bulk_invalidates_list_cache(self):
+        """ Test a bulk write is visible in the next list call """
+        self.client.get(RECIPE_URL)
+        self.client.post(BULK_URL, self._payload(2), format='json')
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(res.data['results']), 2)
+
+
+class ExportRecipeAPITests(TestCase):
+    """ Test the recipe export API """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    @patch('recipe.views.RecipeViewSet.export_chunk_size', 2)
+    def test_export_recipes(self):
+        """ Test exporting streams every recipe in the detail format """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(tag)
+        create_recipe(
+            user=create_user(email='other@example.com', password='test123')
+        )
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        expected = RecipeDetailSerializer(recipes, many=True).data
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            json.loads(json.dumps(expected))
+        )
+
+    def test_export_requires_auth(self):
+        """ Test exporting requires authentication """
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class FacetsRecipeAPITests(TestCase):
+    """ Test the recipe facet counts API """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.r1 = create_recipe(user=self.user, title='Tomato soup')
+        self.r1.tags.add(self.vegan, self.quick)
+        self.r1.ingredients.add(self.salt)
+        self.r2 = create_recipe(user=self.user, title='Onion soup')
+        self.r2.tags.add(self.vegan)
+        self.r2.ingredients.add(self.salt)
+        create_recipe(user=self.user, title='Plain toast')
+
+    def test_facet_counts(self):
+        """ Test counting recipes per tag and ingredient """
+        other = create_user(email='other@example.com', password='test123')
+        recipe = create_recipe(user=other)
+        recipe.tags.add(Tag.objects.create(user=other, name='Vegan'))
+        Tag.objects.create(user=self.user, name='Unused')
+
+        res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'tags': [
+                {'id': self.vegan.id, 'name': 'Vegan', 'count': 2},
+                {'id': self.quick.id, 'name': 'Quick', 'count': 1},
+            ],
+            'ingredients': [
+                {'id': self.salt.id, 'name': 'Salt', 'count': 2},
+            ],
+        })
+
+    def test_facet_counts_narrowed_by_filters(self):
+        """ Test facets only count recipes matching the list filters """
+        res = self.client.get(FACETS_URL, {'tags': self.quick.id})
+
+        self.assertEqual(
+            [(tag['name'], tag['count']) for tag in res.data['tags']],
+            [('Quick', 1), ('Vegan', 1)]
+        )
+
+        res = self.client.get(FACETS_URL, {'search': 'onion'})
+
+        self.assertEqual(
+            [(tag['name'], tag['count']) for tag in res.data['tags']],
+            [('Vegan', 1)]
+        )
+
+    def test_facets_invalid_ids(self):
+        """ Test ids that are not integers are rejected """
+        for params in ({'tags': 'abc'}, {'ingredients': f'1,{2 ** 63}'}):
+            res = self.client.get(FACETS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(list(res.data), list(params))
+
+    def test_facets_one_query_per_relation(self):
+        """ Test each facet is a single aggregate query """
+        with self.assertNumQueries(3):
+            self.client.get(FACETS_URL)
+
+    def test_facets_served_from_cache(self):
+        """ Test repeated facet calls only look up the data version """
+        self.client.get(FACETS_URL)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.data['ingredients'][0]['count'], 2)
+
+    def test_facets_cache_invalidated_on_write(self):
+        """ Test facet counts change when the user's data changes """
+        self.client.get(FACETS_URL)
+
+        self.r2.delete()
+        res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.data['ingredients'][0]['count'], 1)
+
+
+class StatsRecipeAPITests(TestCase):
+    """ Test the recipe statistics API """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def test_stats_without_recipes(self):
+        """ Test a user without recipes gets empty statistics """
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['average_price'])
+        self.assertEqual(
+            [bucket['count'] for bucket in res.data['price_distribution']],
+            [0, 0, 0, 0, 0]
+        )
+        self.assertEqual(res.data['tags'], [])
+
+    def test_stats_follow_api_writes(self):
+        """ Test statistics follow creates and updates through the API """
+        for price, tags in (('4.00', ['Vegan']), ('25.00', ['Vegan', 'Soup'])):
+            self.client.post(RECIPE_URL, {
+                'title': 'Recipe',
+                'time_minutes': 10,
+                'price': price,
+                'tags': [{'name': name} for name in tags],
+                'ingredients': [],
+            }, format='json')
+        recipe = Recipe.objects.filter(user=self.user).latest('id')
+        self.client.patch(detail_url(recipe.id), {
+            'time_minutes': 20,
+            'tags': [{'name': 'Soup'}],
+        }, format='json')
+        create_recipe(
+            user=create_user(email='other@example.com', password='test123')
+        )
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_time_minutes'], 15)
+        self.assertEqual(res.data['average_price'], '14.50')
+        self.assertEqual(res.data['total_price'], '29.00')
+        self.assertEqual(
+            [bucket['count'] for bucket in res.data['price_distribution']],
+            [1, 0, 0, 1, 0]
+        )
+        self.assertEqual(
+            [(tag['name'], tag['count']) for tag in res.data['tags']],
+            [('Soup', 1), ('Vegan', 1)]
+        )
+
+    def test_stats_follow_bulk_writes(self):
+        """ Test bulk writes, which skip model signals, update the stats """
+        recipe = create_recipe(user=self.user, price=Decimal('60.00'))
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Old'))
+
+        self.client.post(BULK_URL, [
+            {
+                'id': recipe.id,
+                'title': 'Updated',
+                'time_minutes': 5,
+                'price': '1.00',
+                'tags': [{'name': 'New'}],
+            },
+            {
+                'title': 'Bulk',
+                'time_minutes': 5,
+                'price': '1.50',
+                'ingredients': [{'name': 'Salt'}],
+            },
+        ], format='json')
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['total_price'], '2.50')
+        self.assertEqual(
+            [(tag['name'], tag['count']) for tag in res.data['tags']],
+            [('New', 1)]
+        )
+        self.assertEqual(res.data['ingredients'][0]['name'], 'Salt')
+
+    def test_stats_single_row_read(self):
+        """ Test reading the stats does not aggregate over recipes """
+        for _ in range(3):
+            create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(STATS_URL)
+
+        for query in ctx.captured_queries:
+            self.assertNotIn('core_recipe', query['sql'])
+
+    def test_stats_requires_auth(self):
+        """ Test the statistics require authentication """
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class ImageUploadTests(TestCase):
     """ Tests for Image upload API """
@@ -471,10 +1416,63 @@ class ImageUploadTests(TestCase):
             res = self.client.post(url, payload, format='multipart')
         
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('image', res.data)
+        self.assertEqual(res.data['image_status'], Recipe.IMAGE_PENDING)
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_PENDING)
         self.assertTrue(os.path.exists(self.recipe.image.path))
+
+    def test_detail_lists_image_variants(self):
+        """ Test recipe detail returns variant URLs and status """
+        self.recipe.image_status = Recipe.IMAGE_READY
+        self.recipe.image_variants = {
+            'thumbnail': 'uploads/recipe/variants/a-thumbnail.jpg',
+        }
+        self.recipe.save()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.data['image_status'], Recipe.IMAGE_READY)
+        self.assertTrue(res.data['image_variants']['thumbnail'].endswith(
+            '/uploads/recipe/variants/a-thumbnail.jpg'
+        ))
     
+    def test_upload_image_skips_prefetch(self):
+        """ Test uploading an image does not prefetch relations """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            img = Image.new('RGB', (10,10))
+            img.save(image_file,format='JPEG')
+            image_file.seek(0)
+
+            # Fetch, update, data version bump and stored file reference.
+            with self.assertNumQueries(4):
+                res = self.client.post(
+                    url,
+                    {'image': image_file},
+                    format='multipart'
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_update_ignores_image(self):
+        """ Test the image can only be changed by uploading it """
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+
+            res = self.client.patch(
+                detail_url(self.recipe.id),
+                {'title': 'New title', 'image': image_file},
+                format='multipart'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'New title')
+        self.assertFalse(self.recipe.image)
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_NONE)
+
     def test_upload_image_bad_request(self):
         """ Test uplaoding an invalid image """
         url = image_upload_url(self.recipe.id)
@@ -0,0 +1,117 @@
+""" Tests for the Recipe API renderers and parsers """
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import skipIf
+from unittest.mock import patch
+import uuid
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from recipe.parsers import FastJSONParser
+from recipe.renderers import FastJSONRenderer, orjson
+
+PAYLOADS = [
+    [],
+    {},
+    'plain',
+    OrderedDict([('id', 1), ('title', 'Crème brûlée 🍮'), ('price', '5.50')]),
+    {'text': 'tab\t newline\n quote" backslash\\ nul\x00 del\x7f'},
+    {'separators': 'line\u2028paragraph\u2029end'},
+    {'floats': [0.1, 1.5, -0.0, 1e16, 1e-05, 2.5e-07, 123456.789, 1e300]},
+    {'decimal': Decimal('5.50'), 'big': 2 ** 70, 'negative': -2 ** 63},
+    {'when': datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)},
+    {'uuid': uuid.UUID(int=1), 'lazy': gettext_lazy('Recipe')},
+    {'errors': [ErrorDetail('This field is required.', code='required')]},
+    {1: 'int key', 'set': {3}, 'tuple': (1, 2), 'none': None, 'bool': True},
+]
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """ Test FastJSONRenderer writes exactly what JSONRenderer writes """
+
+    def test_identical_output(self):
+        """ Test the rendered bytes match DRF's renderer """
+        for data in PAYLOADS:
+            self.assertEqual(
+                FastJSONRenderer().render(data),
+                JSONRenderer().render(data),
+                data
+            )
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_used(self):
+        """ Test payloads without mismatching floats skip the json module """
+        with patch('recipe.renderers.json.dumps') as dumps:
+            FastJSONRenderer().render(PAYLOADS[3])
+
+        dumps.assert_not_called()
+
+    def test_identical_without_orjson(self):
+        """ Test the json module fallback renders the same """
+        with patch('recipe.renderers.orjson', None):
+            for data in PAYLOADS:
+                self.assertEqual(
+                    FastJSONRenderer().render(data),
+                    JSONRenderer().render(data),
+                    data
+                )
+
+    def test_indented_output(self):
+        """ Test indented rendering, e.g. for the browsable API """
+        data = {'id': 1, 'tags': [{'name': 'Vegan'}]}
+
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4')
+        )
+
+    def test_none_renders_empty(self):
+        """ Test no data renders an empty body """
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """ Test FastJSONParser reads exactly what JSONParser reads """
+
+    def _parse(self, parser, body, encoding='utf-8'):
+        try:
+            return parser.parse(BytesIO(body), parser_context={
+                'encoding': encoding,
+            })
+        except ParseError as exc:
+            return str(exc)
+
+    def test_identical_results(self):
+        """ Test parsed data and errors match DRF's parser """
+        bodies = [
+            b'[{"title": "Cr\\u00e8me", "price": "5.50", "tags": []}]',
+            '{"title": "Crème brûlée"}'.encode(),
+            b'{"price": 5.1, "time": 1e400, "id": 123456789012345678901}',
+            b'{"a": 1, "a": 2}',
+            b'"\\ud800"',
+            b'{"price": NaN}',
+            b'{"title": ',
+            b'',
+        ]
+        for body in bodies:
+            self.assertEqual(
+                self._parse(FastJSONParser(), body),
+                self._parse(JSONParser(), body),
+                body
+            )
+
+    def test_other_encodings(self):
+        """ Test bodies in other encodings use DRF's parser """
+        body = '{"title": "Crème"}'.encode('utf-16')
+
+        self.assertEqual(
+            self._parse(FastJSONParser(), body, 'utf-16'),
+            {'title': 'Crème'}
+        )
@@ -52,7 +52,7 @@ class PrivateTagsAPITests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """ Test retrieve tags limited to the authenticated user """
@@ -63,9 +63,22 @@ class PrivateTagsAPITests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
+
+    def test_tags_paginated_by_name(self):
+        """ Test tags are paginated in descending name order """
+        for name in ('Breakfast', 'Dessert', 'Vegan'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        names = [tag['name'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names += [tag['name'] for tag in res.data['results']]
+
+        self.assertEqual(names, ['Vegan', 'Dessert', 'Breakfast'])
+        self.assertIsNone(res.data['next'])
 
     def test_update_tag(self):
         """ Test updating a tag """
@@ -79,6 +92,17 @@ class PrivateTagsAPITests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_duplicate_name(self):
+        """ Test renaming a tag to an existing name is rejected """
+        Tag.objects.create(user=self.user, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dessert')
+
     def test_delete_tag(self):
         """ Test delete a tag  feature """
         tag = Tag.objects.create(user=self.user, name="Breakfast")
@@ -109,8 +133,8 @@ class PrivateTagsAPITests(TestCase):
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_tags_are_unique(self):
         """ Test filtered tags are unique"""
@@ -135,4 +159,66 @@ class PrivateTagsAPITests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tags_with_counts(self):
+        """ Test listing tags with the number of recipes using them """
+        tag1 = Tag.objects.create(user=self.user, name='vegan')
+        tag2 = Tag.objects.create(user=self.user, name='quick')
+        for title in ('Toast', 'Soup'):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=title,
+                price=Decimal('5.0'),
+                time_minutes=10
+            )
+            recipe.tags.add(tag1)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.data['results'], [
+            {'id': tag1.id, 'name': 'vegan', 'recipe_count': 2},
+            {'id': tag2.id, 'name': 'quick', 'recipe_count': 0},
+        ])
+
+    def test_tags_with_counts_invalid(self):
+        """ Test a with_counts value that is not a boolean is rejected """
+        Tag.objects.create(user=self.user, name='vegan')
+
+        res = self.client.get(TAGS_URL, {'with_counts': 'maybe'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('with_counts', res.data)
+
+        res = self.client.get(TAGS_URL, {'with_counts': 'true'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['recipe_count'], 0)
+
+    def test_tags_sparse_fields(self):
+        """ Test listing tags with only some of their fields """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+
+        res = self.client.get(
+            TAGS_URL,
+            {'with_counts': 1, 'fields': 'id,recipe_count'}
+        )
+
+        self.assertEqual(res.data['results'], [
+            {'id': tag.id, 'recipe_count': 0},
+        ])
+
+    def test_autocomplete_tags(self):
+        """ Test autocompleting tag names by prefix """
+        Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.create(user=self.user, name='Dinner')
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL, {'q': 'd'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Dessert', 'Dinner']
+        )
@@ -16,4 +16,6 @@ app_name = 'recipe'
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
+    path('media/<path:name>', views.RecipeMediaView.as_view(), name='media'),
 ]
\ No newline at end of file
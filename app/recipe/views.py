@@ -1,4 +1,25 @@
 """ Views for Recipe API """
+import mimetypes
+import os
+import re
+from itertools import islice
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    OuterRef,
+    prefetch_related_objects,
+)
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -12,59 +33,214 @@ from rest_framework import (
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
+from core import images
+from core.authentication import CachedTokenAuthentication
 from core.models import (
     Recipe,
     Tag,
-    Ingredient
+    Ingredient,
+    UserRecipeStats,
 )
 from recipe import serializers
+from recipe.mixins import (
+    CachedListMixin,
+    ConditionalMixin,
+    SparseFieldsMixin,
+)
+from recipe.pagination import RecipeAttrCursorPagination
+from recipe.renderers import (
+    FastJSONRenderer,
+    NDJSONRenderer,
+    ndjson_line,
+)
+
+
+# Matches ranked per search, the newest ones, to bound the cost of
+# broad terms.
+SEARCH_MAX_MATCHES = 1000
+
+# Filters shared by the recipe list and its facet counts.
+RECIPE_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of tag IDs to filter'
+    ),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient ids to filter'
+    ),
+    OpenApiParameter(
+        'match',
+        OpenApiTypes.STR, enum=['any', 'all'],
+        description='Match recipes having any (default) or all of '
+                    'the given tags/ ingredients',
+    ),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description='Full text search over title and description, '
+                    'results are ordered by relevance. Only the '
+                    f'{SEARCH_MAX_MATCHES} newest matching recipes are '
+                    'ranked and returned, narrow the query to reach older '
+                    'ones',
+    ),
+]
+
+
+# Sparse fieldsets, see SparseFieldsMixin.
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated list of the only fields to return',
+    ),
+    OpenApiParameter(
+        'omit',
+        OpenApiTypes.STR,
+        description='Comma separated list of fields to leave out',
+    ),
+]
+
+
 @extend_schema_view(
     list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Comma separated list of tag IDs to filter'
-            ),
-            OpenApiParameter(
-                'ingredients',
-                OpenApiTypes.STR,
-                description='Comma separated list of ingredient ids to filter'
-            )
-        ]
-    )
+        parameters=RECIPE_FILTER_PARAMETERS + SPARSE_FIELDS_PARAMETERS
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+        SparseFieldsMixin,
+        ConditionalMixin,
+        CachedListMixin,
+        viewsets.ModelViewSet):
     """ View for manager recipe APIs """
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    bulk_max_items = 5000
+    export_chunk_size = 500
+    search_max_matches = SEARCH_MAX_MATCHES
+    # Read only serializer for list pages, None uses RecipeSerializer.
+    list_serializer_class = serializers.RecipeListSerializer
+    # Filter tags/ ingredients on the denormalized id arrays, False queries
+    # the link tables instead.
+    filter_by_arrays = True
+
+    def _params_into_ints(self, qs, param):
+        """ Convert a list of strings into ints, ids of the param `param` """
+        try:
+            ids = [int(str_id) for str_id in qs.split(',')]
+        except ValueError:
+            ids = None
+        if ids is None or not all(0 < pk < 2 ** 63 for pk in ids):
+            raise ValidationError({param: [
+                'Must be a comma separated list of ids.'
+            ]})
+
+        return ids
+
+    def _filter_by_related(self, queryset, through, field, ids, match):
+        """ Filter recipes linked to any or all of ids without a join """
+        if self.filter_by_arrays:
+            # Recipe.tag_ids/ ingredient_ids, GIN indexed copies of links.
+            lookup = 'contains' if match == 'all' else 'overlap'
+            return queryset.filter(**{f'{field}s__{lookup}': ids})
+
+        links = through.objects.filter(**{f'{field}__in': ids})
 
-    def _params_into_ints(self, qs):
-        """ Convert a list of strings into ints"""
-        return [int(str_id) for str_id in qs.split(',')]
+        if match == 'all':
+            matching = links.values('recipe_id').annotate(
+                matched=Count(field)
+            ).filter(matched=len(set(ids))).values('recipe_id')
+            return queryset.filter(pk__in=matching)
+
+        return queryset.filter(
+            Exists(links.filter(recipe_id=OuterRef('pk')))
+        )
 
     def get_queryset(self):
         """ Retrieve recipers for authenticated user """
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        match = self.request.query_params.get('match', 'any')
         queryset = self.queryset
 
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': ['Must be one of: any, all.']})
+
         if tags:
-            tag_ids = self._params_into_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            tag_ids = self._params_into_ints(tags, 'tags')
+            queryset = self._filter_by_related(
+                queryset, Recipe.tags.through, 'tag_id', tag_ids, match
+            )
         if ingredients:
-            ingredient_ids = self._params_into_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-        
-        return queryset.filter(
-            user= self.request.user,
-        ).order_by('-id').distinct()
+            ingredient_ids = self._params_into_ints(
+                ingredients, 'ingredients'
+            )
+            queryset = self._filter_by_related(
+                queryset,
+                Recipe.ingredients.through,
+                'ingredient_id',
+                ingredient_ids,
+                match,
+            )
+
+        queryset = queryset.filter(user=self.request.user)
+        search = self._get_search()
+        if search:
+            queryset = queryset.search(
+                search,
+                max_matches=self.search_max_matches,
+            )
+
+        ordering = self.get_pagination_ordering()
+        # Rows carry the cursor's ordering keys for pagination.
+        ordering_keys = [field.lstrip('-') for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if self._use_values_list():
+            return queryset.values(
+                *self.list_serializer_class(
+                    fields=self.get_sparse_fields()
+                ).value_fields,
+                *ordering_keys
+            )
+
+        columns = self.get_sparse_columns(*ordering_keys)
+        if columns is not None:
+            queryset = queryset.only(*columns)
+
+        return queryset.prefetch_related(*self._get_prefetch_plan())
+
+    def _use_values_list(self):
+        """ Return whether the list is served from values() rows """
+        return self.action == 'list' and self.list_serializer_class is not None
+
+    def _get_search(self):
+        """ Return the full text search query, if any """
+        return self.request.query_params.get('search', '').strip()
+
+    def get_pagination_ordering(self):
+        """ Order by relevance when searching, newest first otherwise """
+        if self._get_search():
+            return ('-rank', '-id')
+
+        return ('-id',)
+
+    def _get_prefetch_plan(self):
+        """ Return the relations the active serializer needs prefetched """
+        meta = getattr(self.get_serializer_class(), 'Meta', None)
+        return self.get_sparse_prefetches(
+            getattr(meta, 'prefetch_related', [])
+        )
 
     def get_serializer_class(self):
         """ Return serializer class for the request """
@@ -72,22 +248,184 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'facets':
+            return serializers.RecipeFacetsSerializer
         
         return self.serializer_class
 
+    def get_serializer(self, *args, **kwargs):
+        """ Return the fast read only serializer for list pages """
+        if kwargs.get('many') and self._use_values_list():
+            kwargs.setdefault('context', self.get_serializer_context())
+            return self.list_serializer_class(
+                *args,
+                fields=self.get_sparse_fields(),
+                **kwargs
+            )
+
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         """ create a new recipe """
         serializer.save(user=self.request.user)
 
+    @extend_schema(
+        request=serializers.RecipeBulkSerializer(many=True),
+        parameters=[
+            OpenApiParameter(
+                'on_error',
+                OpenApiTypes.STR, enum=['abort', 'skip'],
+                description='abort (default) writes nothing if any item is '
+                            'invalid, skip writes the valid items',
+            ),
+        ],
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """ Create recipes, or update those with an id, in one batch """
+        on_error = request.query_params.get('on_error', 'abort')
+
+        if on_error not in ('abort', 'skip'):
+            raise ValidationError({
+                'on_error': ['Must be one of: abort, skip.']
+            })
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list.']})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [
+                f'At most {self.bulk_max_items} items per request.'
+            ]})
+
+        serializer = serializers.RecipeBulkSerializer(
+            data=request.data,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        validated = serializer.validate_items()
+        failed = any(errors for _, errors in validated)
+        results = [
+            {'index': index, 'status': 'error', 'errors': errors}
+            for index, (_, errors) in enumerate(validated)
+            if errors
+        ]
+
+        if failed and on_error == 'abort':
+            return Response(
+                {'results': results},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = [
+            (index, data)
+            for index, (data, errors) in enumerate(validated)
+            if not errors
+        ]
+        creating = ['id' not in data for _, data in items]
+        recipes = serializer.bulk_save([data for _, data in items])
+
+        results += [
+            {
+                'index': index,
+                'status': 'created' if created else 'updated',
+                'id': recipe.id,
+            }
+            for (index, _), created, recipe in zip(items, creating, recipes)
+        ]
+        results.sort(key=lambda result: result['index'])
+
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @extend_schema(parameters=RECIPE_FILTER_PARAMETERS)
+    @action(methods=['GET'], detail=False, url_path='facets')
+    def facets(self, request):
+        """
+            Count the recipes per tag and per ingredient, narrowed by the
+            same filters as the list. Cached until the user's data changes.
+        """
+        def build():
+            recipes = None
+            if any(request.query_params.get(param) for param in (
+                'tags', 'ingredients', 'search'
+            )):
+                recipes = self.get_queryset().order_by().values('pk')
+
+            serializer = self.get_serializer({
+                'tags': self._count_recipes(Tag, recipes),
+                'ingredients': self._count_recipes(Ingredient, recipes),
+            })
+            return serializer.data
+
+        return Response(self.get_cached_data(request, build))
+
+    def _count_recipes(self, model, recipes=None):
+        """
+            Count the recipes per tag or ingredient in one aggregate query.
+            Without filters every linked recipe is the user's, so the
+            recipe subquery is skipped.
+        """
+        counts = model.objects.filter(user=self.request.user)
+        if recipes is None:
+            counts = counts.filter(recipe__isnull=False)
+        else:
+            counts = counts.filter(recipe__in=recipes)
+
+        return counts.annotate(
+            count=Count('recipe')
+        ).order_by('-count', 'name', 'id').values('id', 'name', 'count')
+
+    @extend_schema(responses={(200, 'application/x-ndjson'): OpenApiTypes.STR})
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        renderer_classes=[NDJSONRenderer, FastJSONRenderer],
+    )
+    def export(self, request):
+        """ Stream every recipe of the user as newline delimited JSON """
+        queryset = self.queryset.filter(user=request.user).order_by('-id')
+        response = StreamingHttpResponse(
+            self._export_lines(queryset),
+            content_type=NDJSONRenderer.media_type,
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+
+        return response
+
+    def _export_lines(self, queryset):
+        """ Yield recipes chunk by chunk from a server side cursor """
+        serializer = serializers.RecipeDetailSerializer(
+            context=self.get_serializer_context()
+        )
+        prefetch = serializers.RecipeDetailSerializer.Meta.prefetch_related
+        recipes = queryset.iterator(chunk_size=self.export_chunk_size)
+
+        while True:
+            chunk = list(islice(recipes, self.export_chunk_size))
+            if not chunk:
+                break
+
+            prefetch_related_objects(chunk, *prefetch)
+            for recipe in chunk:
+                yield ndjson_line(serializer.to_representation(recipe))
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """ Upload an image to recipe """
+        """
+            Upload an image to recipe. Resized variants are made later by
+            the process_images worker.
+        """
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            serializer.save(
+                image_status=Recipe.IMAGE_PENDING,
+                image_variants={},
+                image_attempts=0,
+            )
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -98,40 +436,216 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0,1],
                 description='Integer value to filter the assigned tags/ ingredients to recipe',
-            )
+            ),
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='Autocomplete names by prefix or similarity, '
+                            'returns an unpaginated list of the best '
+                            'matches',
+            ),
+            OpenApiParameter(
+                'with_counts',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Include the number of recipes using each '
+                            'tag/ ingredient as recipe_count',
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
         ]
     )
 )
 class BaseRecipeAttrViewSet(
+    SparseFieldsMixin,
+    ConditionalMixin,
+    CachedListMixin,
     mixins.DestroyModelMixin,
     mixins.UpdateModelMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet):
     """ Base Recipe attributes viewset """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes =  [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+    autocomplete_max_results = 20
 
     def get_queryset(self):
         """ Filter queryset to authenticated user """
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
-        queryset = self.queryset
+        queryset = self.queryset.filter(
+            user=self.request.user
+        ).order_by('-name')
 
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
+            queryset = queryset.assigned()
+        if self._with_counts():
+            queryset = queryset.with_recipe_count()
+
+        columns = self.get_sparse_columns('name')
+        if columns is not None:
+            queryset = queryset.only(*columns)
+
+        text = self._get_autocomplete()
+        if text:
+            queryset = queryset.autocomplete(
+                text,
+                self.autocomplete_max_results,
+            )
+
+        return queryset
+
+    def _with_counts(self):
+        """ Return whether recipe counts were requested """
+        if self.action != 'list':
+            return False
+
+        value = self.request.query_params.get('with_counts', '0')
+        try:
+            return BooleanField().to_internal_value(value)
+        except ValidationError as exc:
+            raise ValidationError({'with_counts': exc.detail})
+
+    def get_serializer_class(self):
+        """ Return serializer class for the request """
+        if self._with_counts():
+            return self.count_serializer_class
+
+        return self.serializer_class
+
+    def _get_autocomplete(self):
+        """ Return the autocomplete text, if any """
+        if self.action != 'list':
+            return ''
+
+        return self.request.query_params.get('q', '').strip()
+
+    def paginate_queryset(self, queryset):
+        """ Autocomplete results are capped instead of paged """
+        if self._get_autocomplete():
+            return None
+
+        return super().paginate_queryset(queryset)
+
+    def perform_update(self, serializer):
+        """
+            Update the attribute, names are unique per user. The unique
+            constraint decides, a check beforehand would race concurrent
+            renames.
+        """
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({'name': ['This name is already in use.']})
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """ Manage tags in the viewsets """
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
     
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """ View for Ingredients API """
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()
+
+
+class RecipeStatsView(APIView):
+    """
+        Recipe statistics of the user. They are kept up to date as recipes
+        change, reading them does not aggregate over the recipes.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = serializers.RecipeStatsSerializer
+
+    def get(self, request):
+        """ Return the user's recipe statistics """
+        stats = UserRecipeStats.objects.filter(user=request.user).first()
+        if stats is None:
+            stats = UserRecipeStats(user=request.user)
+
+        serializer = self.serializer_class({
+            'recipe_count': stats.recipe_count,
+            'average_time_minutes': stats.average_time_minutes,
+            'average_price': stats.average_price,
+            'total_price': stats.total_price,
+            'price_distribution': stats.price_distribution,
+            'tags': self._facets(Tag, stats.tag_counts),
+            'ingredients': self._facets(Ingredient, stats.ingredient_counts),
+        })
+
+        return Response(serializer.data)
+
+    def _facets(self, model, counts):
+        """ Name the {id: count} pairs of the stats, most used first """
+        if not counts:
+            return []
+
+        names = model.objects.filter(
+            user=self.request.user,
+            pk__in=[int(pk) for pk in counts],
+        ).values_list('id', 'name')
+
+        return sorted(
+            (
+                {'id': pk, 'name': name, 'count': counts[str(pk)]}
+                for pk, name in names
+            ),
+            key=lambda facet: (-facet['count'], facet['name'], facet['id'])
+        )
+
+
+class RecipeMediaView(APIView):
+    """
+        Serve recipe images to their owners. Django only checks access,
+        with MEDIA_ACCEL_REDIRECT set nginx sends the file itself.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Content addressed names never change content, cache them for good.
+    immutable_name = re.compile(
+        r'^uploads/recipe/(variants/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}'
+    )
+
+    @extend_schema(responses={200: OpenApiTypes.BINARY})
+    def get(self, request, name):
+        """ Return the image file `name` """
+        source = images.source_name(name)
+        if (
+            source is None
+            or os.path.normpath(name) != name
+            or not Recipe.objects.filter(
+                user=request.user,
+                image=source,
+            ).exists()
+        ):
+            raise Http404
+
+        prefix = settings.MEDIA_ACCEL_REDIRECT
+        if prefix:
+            response = HttpResponse(
+                content_type=mimetypes.guess_type(name)[0]
+            )
+            response['X-Accel-Redirect'] = f'{prefix}{quote(name)}'
+        else:
+            storage = Recipe._meta.get_field('image').storage
+            try:
+                response = FileResponse(storage.open(name))
+            except FileNotFoundError:
+                raise Http404
+
+        if self.immutable_name.match(name):
+            patch_cache_control(
+                response,
+                private=True,
+                max_age=365 * 24 * 60 * 60,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
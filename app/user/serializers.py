@@ -22,15 +22,20 @@ class UserSerializer(serializers.ModelSerializer):
         return get_user_model().objects.create_user(**validated_data)
 
     def update(self, instance, validated_data):
-        """ update and return user"""
+        """ update and return user, writing only the given fields """
         password = validated_data.pop('password', None)
-        user = super().update(instance,validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        fields = list(validated_data)
 
         if password:
-            user.set_password(password)
-            user.save()
-        
-        return user
+            instance.set_password(password)
+            fields.append('password')
+
+        if fields:
+            instance.save(update_fields=fields)
+
+        return instance
     
 class AuthTokenSerializer(serializers.Serializer):
     """ Serializer for the user token """
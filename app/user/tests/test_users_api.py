@@ -159,3 +159,13 @@ class PrivateUserAPITests(TestCase):
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_update_user_profile_keeps_other_fields(self):
+        """ Test updating the profile does not write back stale fields """
+        get_user_model().objects.bump_data_version(self.user.pk)
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Updated name')
+        self.assertEqual(self.user.data_version, 1)
@@ -1,10 +1,13 @@
 """
  Views for the User API
 """
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication
+
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer
@@ -21,9 +24,16 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """ Manage the authenticated user """
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        """ Retrieve and return the authenticated user """
-        return self.request.user
\ No newline at end of file
+        """
+            Retrieve and return the authenticated user. request.user may
+            come from the token cache, so it is read again before writes
+            to not save stale fields back.
+        """
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+
+        return get_user_model().objects.get(pk=self.request.user.pk)
@@ -1,8 +1,31 @@
 server {
     listen ${LISTEN_PORT};
 
+    sendfile           on;
+    tcp_nopush         on;
+
+    # Keep descriptors and metadata of hot files instead of stat()ing them
+    # on every request.
+    open_file_cache          max=10000 inactive=5m;
+    open_file_cache_valid    2m;
+    open_file_cache_min_uses 1;
+    open_file_cache_errors   on;
+
     location /static {
         alias /vol/static;
+        expires 7d;
+    }
+
+    # Media is only reachable through the app's access check.
+    location /static/media/ {
+        return 404;
+    }
+
+    # Target of X-Accel-Redirect from the media view, the Cache-Control
+    # header set by the app is kept.
+    location /protected-media/ {
+        internal;
+        alias /vol/static/media/;
     }
 
     location / {